@@ -0,0 +1,135 @@
+"""
+Stand-in for Ollama's /api/chat that replays the tool calls chat-backend
+expects, so /chat can be load tested without a model.
+
+Each request is answered the way qwen3 usually answers the bookstore prompt:
+
+  tools include book_search, no tool result yet   book_search(query=<last user message>)
+  tools include reply                             reply(reply=<canned answer>)
+  no tools (the streamed answer round)            the canned answer as content
+
+Latency is scripted: --first-token-ms before the first byte, then
+--token-ms per streamed token (non-streaming replies wait for all tokens).
+
+    python benchmarks/fake_ollama.py --port 11434 --first-token-ms 300 --token-ms 20
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ANSWER = "Here are a few books you might like, all in stock and ready to ship today."
+
+
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, first_token_ms=200.0, token_ms=15.0, jitter=0.1, books=3, answer=ANSWER):
+        super().__init__(address, Handler)
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.jitter = jitter
+        self.books = books
+        self.answer = answer
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-stream are part of load testing, not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def delay(self, ms):
+        time.sleep(max(ms * (1 + random.uniform(-self.jitter, self.jitter)), 0) / 1000)
+
+    def script(self, body):
+        """The assistant message for this request, and the tokens its content streams as."""
+        tools = {t["function"]["name"] for t in body.get("tools") or []}
+        messages = body.get("messages") or []
+        searched = any(m.get("role") == "tool" for m in messages)
+        question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        if "book_search" in tools and not searched:
+            call = {"name": "book_search", "arguments": {"query": question, "numberOfBooks": self.books}}
+            return {"role": "assistant", "content": "", "tool_calls": [{"function": call}]}, []
+        if "reply" in tools:
+            call = {"name": "reply", "arguments": {"reply": self.answer}}
+            return {"role": "assistant", "content": "", "tool_calls": [{"function": call}]}, []
+        return {"role": "assistant", "content": self.answer}, [w + " " for w in self.answer.split()]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        server = self.server
+        with server._lock:
+            server.requests += 1
+        message, tokens = server.script(body)
+        server.delay(server.first_token_ms)
+
+        if not body.get("stream", True):
+            for _ in tokens[1:]:
+                server.delay(server.token_ms)
+            data = json.dumps({"model": body.get("model"), "message": message, "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        # NDJSON like Ollama: content tokens, tool calls in one chunk, then done
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunks = [{"message": {"role": "assistant", "content": t}, "done": False} for t in tokens]
+        if message.get("tool_calls"):
+            chunks.append({"message": {"role": "assistant", "content": "", "tool_calls": message["tool_calls"]}, "done": False})
+        chunks.append({"message": {"role": "assistant", "content": ""}, "done": True})
+        for i, chunk in enumerate(chunks):
+            if i and tokens:
+                server.delay(server.token_ms)
+            data = (json.dumps(chunk) + "\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start(port=11434, host="127.0.0.1", **options):
+    """Serves in a daemon thread, returns the server (call shutdown() to stop it)."""
+    server = FakeOllama((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="wait before the first byte of every reply")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="wait between streamed tokens")
+    parser.add_argument("--jitter", type=float, default=0.1, help="random +- fraction applied to every wait")
+    parser.add_argument("--books", type=int, default=3, help="numberOfBooks asked for in book_search calls")
+    args = parser.parse_args()
+
+    server = FakeOllama((args.host, args.port), args.first_token_ms, args.token_ms, args.jitter, args.books)
+    print(f"Fake Ollama on http://{args.host}:{args.port}/api/chat", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
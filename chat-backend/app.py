@@ -1,204 +1,582 @@
 import os
-import sys
-import json
+import time
 import requests
 from dotenv import load_dotenv
 import faiss
 import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from embedding_store import EmbeddingStore, content_id
+import index_factory
+from cache import LRUCache
+from batcher import MicroBatcher
+from catalog import Catalog, DocMap, FIELDS
+from streaming import ThinkFilter, iter_ndjson, sse
+from router import Router
+from sessions import SessionStore, compact_history
+from response_cache import SemanticCache
+from result_cache import ResultCache
+from live_sync import LiveSync
+from lexical import rrf
+from snapshot import (
+    Snapshot, SnapshotWatcher, RebuildWorker, rebuild_lock, current_name,
+    write_snapshot, open_snapshot, read_index, snapshot_path, INDEX_FILE,
+)
+from llm_client import LLMClient, AsyncLLMClient, LLMEventLoop, run_chat, run_chat_async
+from metrics import HTTP_SECONDS, LLM_ROUNDS, debug_log, span
+import metrics
 
 load_dotenv('./.env')
 
+DB_BACKEND_URL = os.getenv('DB_BACKEND_URL', 'http://db-backend:6060')
 INDEX_PATH = os.getenv('INDEX_PATH', './data') 
+#Index and pickle files from before snapshots (see snapshot.py), only read to migrate them
 INDEX_NAME = os.getenv('INDEX_NAME', 'faiss.index')
 DATAFRAME_NAME = os.getenv('DATAFRAME_NAME', 'books.pkl')
-
-#MAKE THESE IN .env
-LLM_ENDPOINT = 'http://host.docker.internal:11434/api/chat'
+#Memory-map snapshot files instead of reading them into each process
+SNAPSHOT_MMAP = os.getenv('SNAPSHOT_MMAP', 'true').lower() == 'true'
+SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '3'))
+#How often each worker process checks for a snapshot built by another one
+SNAPSHOT_POLL_SECONDS = float(os.getenv('SNAPSHOT_POLL_SECONDS', '2'))
+EMBEDDINGS_NAME = os.getenv('EMBEDDINGS_NAME', 'embeddings.npz')
+EMBED_MODEL = os.getenv('EMBED_MODEL', 'all-MiniLM-L6-v2')
+
+#FAISS index kind (flat, ivf, hnsw, ivfpq) and its tuning knobs, see index_factory.py
+INDEX_TYPE = os.getenv('INDEX_TYPE', 'flat')
+INDEX_NLIST = int(os.getenv('INDEX_NLIST', '0'))  # 0 picks a value from the catalog size
+INDEX_HNSW_M = int(os.getenv('INDEX_HNSW_M', '32'))
+INDEX_PQ_M = int(os.getenv('INDEX_PQ_M', '0'))  # 0 picks a value from the embedding size
+INDEX_NPROBE = int(os.getenv('INDEX_NPROBE', '16'))
+INDEX_EF_SEARCH = int(os.getenv('INDEX_EF_SEARCH', '64'))
+
+#Normalized query -> embedding, so repeated searches skip model.encode
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '2048'))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', '3600'))  # seconds, 0 = never expire
+
+#Concurrent searches are encoded and searched together, SEARCH_BATCH_SIZE=1 turns this off
+SEARCH_BATCH_SIZE = int(os.getenv('SEARCH_BATCH_SIZE', '16'))
+SEARCH_BATCH_WAIT_MS = float(os.getenv('SEARCH_BATCH_WAIT_MS', '2'))
+
+#How faiss_search ranks books: hybrid fuses FAISS and BM25 keyword results (see lexical.py), or vector / lexical alone
+SEARCH_MODE = os.getenv('SEARCH_MODE', 'hybrid')
+SEARCH_MODES = ('hybrid', 'vector', 'lexical')
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '50'))  # results taken from each side before fusing
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+#Typeahead suggestions per /autocomplete request, see autocomplete.py
+AUTOCOMPLETE_K = int(os.getenv('AUTOCOMPLETE_K', '8'))
+AUTOCOMPLETE_MAX_K = int(os.getenv('AUTOCOMPLETE_MAX_K', '20'))
+
+#Apply changes to the books collection between rebuilds, see live_sync.py. Empty SYNC_MONGO_URI turns it off
+SYNC_MONGO_URI = os.getenv('SYNC_MONGO_URI', '')
+SYNC_DB = os.getenv('SYNC_DB', 'mydb')
+SYNC_COLLECTION = os.getenv('SYNC_COLLECTION', 'books')
+SYNC_MODE = os.getenv('SYNC_MODE', 'auto')  # auto, changestream or poll
+SYNC_BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '200'))
+SYNC_BATCH_WAIT_MS = float(os.getenv('SYNC_BATCH_WAIT_MS', '500'))
+SYNC_POLL_SECONDS = float(os.getenv('SYNC_POLL_SECONDS', '2'))
+SYNC_RECONCILE_SECONDS = float(os.getenv('SYNC_RECONCILE_SECONDS', '300'))  # polling only, finds deletes
+SYNC_COMPACT_AFTER = int(os.getenv('SYNC_COMPACT_AFTER', '1000'))  # pending changes before a rebuild
+
+LLM_ENDPOINT = os.getenv('LLM_ENDPOINT', 'http://host.docker.internal:11434/api/chat')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL',"qwen3:1.7b")
-
-
-model = SentenceTransformer("all-MiniLM-L6-v2")
-index = None
-booksDataFrame= None
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '120'))
+LLM_RETRIES = int(os.getenv('LLM_RETRIES', '2'))
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '16'))
+#Make the /chat LLM calls from the shared asyncio loop (the request thread still waits for the reply)
+LLM_ASYNC = os.getenv('LLM_ASYNC', 'true').lower() == 'true'
+
+#Answer exact ISBN/title, FAQ and near-identical search hits without the LLM, see router.py
+ROUTER_ENABLED = os.getenv('ROUTER_ENABLED', 'true').lower() == 'true'
+FAQ_URL = os.getenv('FAQ_URL', '')  # /faq of db-backend/DBprocess.py, empty skips the FAQ check
+ROUTER_FAQ_MIN_SCORE = int(os.getenv('ROUTER_FAQ_MIN_SCORE', '90'))
+ROUTER_VECTOR_MIN_SIM = float(os.getenv('ROUTER_VECTOR_MIN_SIM', '0.92'))  # above 1 disables it
+
+#Server-side chat history keyed by session id, see sessions.py
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')  # memory or sqlite
+SESSION_DB = os.getenv('SESSION_DB', os.path.join(INDEX_PATH, 'sessions.db'))
+SESSION_MAX = int(os.getenv('SESSION_MAX', '10000'))
+SESSION_TTL = float(os.getenv('SESSION_TTL', '3600'))
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '1500'))
+HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', '2'))
+
+#Replies to opening questions reused for near-identical questions, see response_cache.py
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1000'))  # 0 disables it
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+RESPONSE_CACHE_MIN_SIM = float(os.getenv('RESPONSE_CACHE_MIN_SIM', '0.95'))
+
+#faiss_search results per catalog version, see result_cache.py. A Redis URL shares them between workers and replicas
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '4096'))  # 0 disables it
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '600'))
+RESULT_CACHE_REDIS_URL = os.getenv('RESULT_CACHE_REDIS_URL', '')
+
+
+model = SentenceTransformer(EMBED_MODEL)
+#The live FAISS index and the columnar book data behind it, replaced as a whole by rebuilds (see snapshot.py)
+snapshot = None
+queryCache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+if SESSION_BACKEND == 'sqlite':
+    os.makedirs(os.path.dirname(SESSION_DB) or '.', exist_ok=True)
+sessionStore = SessionStore(SESSION_MAX, SESSION_TTL, SESSION_BACKEND, SESSION_DB)
+responseCache = SemanticCache(
+    model.get_sentence_embedding_dimension(), RESPONSE_CACHE_MIN_SIM, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+)
+resultCache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_REDIS_URL)
 
 app = Flask(__name__)
 
-def build_index():
-    global index
-    global booksDataFrame
+def fetch_catalog():
+    """
+    Streams the catalog from db-backend as NDJSON straight into column lists, so
+    neither side holds the whole response body or a dict per book in memory.
+    """
+    # _id ties each book to the changes live sync receives for it
+    fields = ["_id"] + FIELDS
+    columns = {field: [] for field in fields}
+    with requests.get(
+        f"{DB_BACKEND_URL}/books",
+        params={"format": "ndjson", "fields": ",".join(fields)},
+        stream=True,
+        timeout=(5, 60),  # connect, and at most 60s between chunks
+    ) as response:
+        response.raise_for_status()
+        for book in iter_ndjson(response):
+            for field in fields:
+                columns[field].append(book.get(field))
+    # object columns keep ints as ints and nulls as None, a numeric dtype would widen both to float
+    return pd.DataFrame(columns, dtype=object).rename(columns={"_id": "doc_id"})
+
+def build_index(full=False):
+    """
+    Fetches the catalog from db-backend and brings the FAISS index up to date.
+    Vectors are reused from the embedding store when the embedded text is unchanged,
+    so only new or edited books are encoded. Pass full=True to re-encode everything.
+    The new snapshot is built on the side and only published once complete, so
+    searches keep using the old one meanwhile. Returns how many vectors were
+    reused, added and removed.
+    """
+    live = snapshot.base if snapshot is not None else None
+    as_of = time.time()
 
     print("Fetching book data from db-backend...")
     try:
-        # Fetch JSON from the db-backend service
-        response = requests.get("http://db-backend:6060/books", timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        # Convert JSON list of dicts into a DataFrame
-        booksDataFrame = pd.DataFrame(data)
-        if booksDataFrame.empty:
+        # Stream the books from the db-backend service into a DataFrame
+        newDataFrame = fetch_catalog()
+        if newDataFrame.empty:
             raise ValueError("Received empty book data from db-backend.")
 
         # Combine title and author text for vector embedding
-        booksDataFrame['combined'] = (
-            booksDataFrame["title"].astype(str) + " by " + booksDataFrame["authors"].astype(str)
+        newDataFrame['combined'] = (
+            newDataFrame["title"].astype(str) + " by " + newDataFrame["authors"].astype(str)
         )
+        newDataFrame['vector_id'] = newDataFrame['combined'].map(content_id).astype('int64')
 
-        # Save DataFrame for reuse
         os.makedirs(INDEX_PATH, exist_ok=True)
-        booksDataFrame.to_pickle(os.path.join(INDEX_PATH, DATAFRAME_NAME))
-
-        # Encode with SentenceTransformer
-        embeddings = model.encode(booksDataFrame['combined'].tolist(), convert_to_numpy=True)
-        dim = embeddings.shape[1]
-
-        # Create and store FAISS index
-        new_index = faiss.IndexFlatL2(dim)
-        new_index.add(embeddings)
-        faiss.write_index(new_index, os.path.join(INDEX_PATH, INDEX_NAME))
-
-        index = new_index
-        print("FAISS index built from db-backend data and loaded successfully.")
+        store_path = os.path.join(INDEX_PATH, EMBEDDINGS_NAME)
+        store = EmbeddingStore(EMBED_MODEL) if full else EmbeddingStore.load(store_path, EMBED_MODEL)
+        old_count = len(store)
+
+        # Work out the delta against the stored embeddings
+        unique = newDataFrame.drop_duplicates('vector_id')
+        wanted = unique['vector_id'].to_numpy()
+        known, removed_ids = store.delta(wanted)
+        reused_ids = wanted[known]
+        added_ids = wanted[~known]
+
+        # Encode with SentenceTransformer (new or changed books only)
+        added_vectors = None
+        if len(added_ids):
+            added_vectors = model.encode(unique['combined'][~known].tolist(), convert_to_numpy=True)
+        store.update(reused_ids, added_ids, added_vectors)
+
+        # Patch a copy of the live index when it matches the store, otherwise train and build a fresh one
+        kind = index_factory.resolve_kind(INDEX_TYPE, len(store))
+        patchable = (
+            not full
+            and live is not None
+            and index_factory.index_kind(live.index) == kind
+            and live.index.ntotal == old_count
+            and (index_factory.supports_remove(live.index) or not len(removed_ids))
+        )
+        if patchable:
+            # Memory-mapped indexes are read-only, so patch a heap copy read from the live snapshot's file
+            if live.name:
+                new_index = read_index(os.path.join(snapshot_path(INDEX_PATH, live.name), INDEX_FILE), mmap=False)
+            else:
+                new_index = faiss.clone_index(live.index)
+            if len(removed_ids):
+                new_index.remove_ids(removed_ids)
+            if len(added_ids):
+                new_index.add_with_ids(added_vectors, added_ids)
+        else:
+            if kind != INDEX_TYPE:
+                print(f"Catalog too small to train a '{INDEX_TYPE}' index, using '{kind}'.", flush=True)
+            new_index = index_factory.build(
+                kind, store.vectors, store.ids,
+                nlist=INDEX_NLIST, hnsw_m=INDEX_HNSW_M, pq_m=INDEX_PQ_M,
+            )
+        index_factory.set_defaults(new_index, INDEX_NPROBE, INDEX_EF_SEARCH)
+
+        # Save embeddings and the new snapshot for reuse, then serve it from disk like a restart would
+        store.save(store_path)
+        docs = None
+        if newDataFrame['doc_id'].notna().all():
+            docs = DocMap.from_columns(newDataFrame['doc_id'], newDataFrame['vector_id'])
+        new_snapshot = Snapshot(new_index, Catalog.from_dataframe(newDataFrame), docs=docs, as_of=as_of)
+        name = write_snapshot(INDEX_PATH, new_snapshot, SNAPSHOT_KEEP)
+        new_snapshot = open_current(name)
+        publish(new_snapshot)
+        stats = {"reused": len(reused_ids), "added": len(added_ids), "removed": len(removed_ids)}
+        print(f"FAISS index built from db-backend data and loaded successfully. {stats}", flush=True)
+        return {"version": new_snapshot.version, **stats}
 
     except Exception as e:
+        # The live snapshot is untouched, keep serving it
         print(f"❌ Error fetching or building index: {e}", flush=True)
-        sys.exit(1)
+        raise
+
+def open_current(name=None):
+    snap = open_snapshot(INDEX_PATH, name, SNAPSHOT_MMAP)
+    if snap is not None:
+        index_factory.set_defaults(snap.index, INDEX_NPROBE, INDEX_EF_SEARCH)
+    return snap
+
+#This loads the index and book data from our index location if they exist.
+def load_snapshot():
+    snap = open_current()
+    if snap is None:
+        if not (os.path.exists(INDEX_PATH + '/' + INDEX_NAME) and os.path.exists(INDEX_PATH + "/" + DATAFRAME_NAME)):
+            return False
+        # Convert the files of older versions into a snapshot once
+        index = faiss.read_index(INDEX_PATH + '/' + INDEX_NAME)
+        dataFrame = pd.read_pickle(INDEX_PATH + "/" + DATAFRAME_NAME)
+        if 'vector_id' not in dataFrame:
+            # Pickles from before the ID-mapped index used row positions as ids
+            dataFrame['vector_id'] = np.arange(len(dataFrame), dtype='int64')
+        snap = open_current(write_snapshot(INDEX_PATH, Snapshot(index, Catalog.from_dataframe(dataFrame)), SNAPSHOT_KEEP))
+    publish(snap)
+    print("Snapshot loaded.", snap.describe(), index_factory.describe(snap.index), flush=True)
+    return True
+
+def reload_snapshot(name):
+    new_snapshot = open_current(name)
+    if new_snapshot is not None:
+        publish(new_snapshot)
+        print("Picked up snapshot", new_snapshot.name, flush=True)
+
+snapshotWatcher = SnapshotWatcher(INDEX_PATH, SNAPSHOT_POLL_SECONDS, reload_snapshot)
+
+def rebuild(full=False, if_missing=False, compacting=None):
+    """
+    Rebuild job. Holds the rebuild lock so worker processes never build at the
+    same time, and starts from whatever snapshot the last build published.
+    if_missing skips the build when a snapshot exists by then (startup).
+    compacting names the snapshot a live-sync overlay grew on; the build is
+    skipped when another process has replaced that snapshot by then.
+    """
+    with rebuild_lock(INDEX_PATH):
+        snapshotWatcher.check(snapshot.name if snapshot else None, force=True)
+        if if_missing and snapshot is not None:
+            return {"version": snapshot.version, "skipped": True}
+        if compacting is not None and snapshot is not None and snapshot.name != compacting:
+            return {"version": snapshot.version, "skipped": True}
+        return build_index(full)
+
+def compact_overlay():
+    # Every worker fills its own overlay from the same changes, so the first one to
+    # get here rebuilds and the others pick that snapshot up instead
+    base = snapshot.name if snapshot is not None else None
+    if base is not None and current_name(INDEX_PATH) != base:
+        snapshotWatcher.check(base, force=True)
+        return
+    rebuildWorker.submit(full=False, compacting=base)
+
+def publish(new_snapshot):
+    if liveSync is not None:
+        # Re-applies the changes the new snapshot does not contain yet, then assigns
+        liveSync.rebase(new_snapshot)
+    else:
+        assign(new_snapshot)
+
+def assign(new_snapshot):
+    # A single assignment, so every search sees either the old or the new snapshot
+    global snapshot
+    old = snapshot
+    snapshot = new_snapshot
+    if old is not None and old.version != new_snapshot.version:
+        # Cached replies may quote books, prices or stock that just changed
+        responseCache.clear()
+        # Keyed by version, so these could never be hit again anyway
+        resultCache.clear()
+
+def normalize_query(query: str) -> str:
+    # all-MiniLM-L6-v2 is uncased, so case and spacing never change the embedding
+    return " ".join(query.lower().split())
+
+def embed_query(query: str):
+    key = normalize_query(query)
+    query_vec = queryCache.get(key)
+    if query_vec is None:
+        with span("embed"):
+            query_vec = model.encode([key], convert_to_numpy=True)
+        query_vec.flags.writeable = False  # shared between requests
+        queryCache.put(key, query_vec)
+    return query_vec
+
+def search_batch(items):
+    """
+    MicroBatcher handler. Each item is (snapshot, normalized query, cached vector or None, k).
+    Encodes all uncached queries in one model.encode call, runs one index.search
+    per snapshot (normally just one) and returns the (distances, ids) found for each item.
+    """
+    vectors = [vec for _, _, vec, _ in items]
+    missing = list(dict.fromkeys(key for _, key, vec, _ in items if vec is None))
+    if missing:
+        # One observation per batch, covering every query encoded in it
+        with span("embed"):
+            encoded = dict(zip(missing, model.encode(missing, convert_to_numpy=True)))
+        for key, vec in encoded.items():
+            vec = vec[None, :]
+            vec.flags.writeable = False
+            queryCache.put(key, vec)
+        vectors = [vec if vec is not None else encoded[key][None, :] for _, key, vec, _ in items]
+
+    # A batch can straddle a snapshot swap, each query is answered by the snapshot it was asked against
+    groups = {}
+    for i, item in enumerate(items):
+        groups.setdefault(id(item[0]), []).append(i)
+    results = [None] * len(items)
+    for positions in groups.values():
+        snap = items[positions[0]][0]
+        with span("faiss"):
+            D, I = snap.search(np.vstack([vectors[i] for i in positions]), max(items[i][3] for i in positions))
+        for row, i in enumerate(positions):
+            k = items[i][3]
+            results[i] = (D[row, :k], I[row, :k])
+    return results
 
-#This loads the index from our index location if it exists.
-def load_index():
-    global index
-    index = faiss.read_index(INDEX_PATH + '/' + INDEX_NAME)
-    print("Index reloaded.")
-    
-def load_data():
-    global booksDataFrame
-    booksDataFrame = pd.read_pickle(INDEX_PATH + "/" + DATAFRAME_NAME)
-    print("Data Loaded")
-
-def faiss_search(query:str, k=5):
-    global index
-    global booksDataFrame
-    
+searchBatcher = MicroBatcher(search_batch, SEARCH_BATCH_SIZE, SEARCH_BATCH_WAIT_MS / 1000)
+
+def search_vectors(snap, query: str, k: int, nprobe=None, ef_search=None):
+    #nprobe (IVF) / ef_search (HNSW) trade recall for latency on this query only
+    if index_factory.search_params(snap.index, nprobe, ef_search) is None and SEARCH_BATCH_SIZE > 1:
+        key = normalize_query(query)
+        return searchBatcher.submit((snap, key, queryCache.get(key), k))
+    query_vec = embed_query(query)
+    with span("faiss"):
+        D, I = snap.search(query_vec, k, nprobe, ef_search)
+    return D[0], I[0]
+
+def top_hit(snap, query: str):
+    # Embeddings are unit length, so a squared L2 distance d is cosine similarity 1 - d/2
+    D, I = search_vectors(snap, query, 1)
+    return 1 - float(D[0]) / 2, I[0]
+
+def search_ids(snap, query: str, k: int, mode=SEARCH_MODE, nprobe=None, ef_search=None):
+    if mode == "lexical":
+        with span("bm25"):
+            return snap.lexical_search(query, k)[1]
+    if mode == "vector":
+        return search_vectors(snap, query, k, nprobe, ef_search)[1]
+    # Exact titles and names rank high in BM25, paraphrases in FAISS; RRF only needs the two rankings
+    depth = max(k, HYBRID_CANDIDATES)
+    _, vector_ids = search_vectors(snap, query, depth, nprobe, ef_search)
+    with span("bm25"):
+        _, lexical_ids = snap.lexical_search(query, depth)
+    return rrf([vector_ids.tolist(), lexical_ids.tolist()], k, HYBRID_RRF_K)
+
+def faiss_search(query:str, k=5, nprobe=None, ef_search=None, mode=None):
     if not query:
         return -1
-    
-    query_vec=model.encode([query],convert_to_numpy=True)
-    
-    #Searches the index and returns the top 20 + k results
-    D, I = index.search(query_vec, k=20+int(k))
-    results = []
-    
-    #This sets the minimum results to 2 distinct results 
-    for i, location in enumerate(I[0]):
-        row=booksDataFrame.iloc[location]
-        row = {
-            "title": row["title"],
-            "authors": row["authors"],
-            "genres": row["genres"],
-            "isbn": row["isbn"],
-            "release_date": row["release_date"],
-            "std_price": row["std_price"],
-            "sale_price": row["sale_price"],
-            "stock_count": row["stock_count"]
-            
-        }
-        print(row, flush=True)
-        #only adds distinct results (there are some repeats in the test dataset)
-        if row not in results:
-            results.append(row)
-        if len(results) >= 2 and len(results) >= int(k):
-            break
+    snap = snapshot
+    if snap is None:
+        raise RuntimeError("The search index is still being built")
+
+    #Duplicates are collapsed in the catalog, so the top k ids are k distinct books (at least 2)
+    k, mode = max(2, int(k)), mode or SEARCH_MODE
+    key = resultCache.key(snap.version, normalize_query(query), k, mode, nprobe, ef_search)
+    results = resultCache.get(key)
+    if results is None:
+        start = time.perf_counter()
+        ids = search_ids(snap, query, k, mode, nprobe, ef_search)
+        with span("materialize"):
+            results = snap.catalog.lookup(ids)
+        resultCache.put(key, results, (time.perf_counter() - start) * 1000)
+    debug_log("faiss_search:", query, lambda: [r["title"] for r in results])
     return results
 
 
 #LLM functions
-def call_llm(messages, tools, stream):
+def book_search_message(query, num_books):
+    if snapshot is None:
+        return {"role": "tool", "content": "The book catalog is still loading.", "tool_name": "book_search"}
+    with span("book_search"):
+        tool_result = faiss_search(query, num_books)
+
+    # Format output for readability
+    tool_output = [
+        f"{r['title']} by {r['authors']} "
+        f"(Genres: {r['genres']}, ISBN: {r['isbn']}, "
+        f"Release Date: {r['release_date']}, "
+        f"Standard Price: ${r['std_price']}, Sale Price: ${r['sale_price']}, Stock: {r['stock_count']})"
+        for r in tool_result
+    ]
+    debug_log("Book_Search called:", query, tool_output)
+
+    return {
+        "role": "tool",
+        "content": "\n".join(tool_output),
+        "tool_name": "book_search"
+    }
+
+llm_settings = dict(
+    connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT,
+    retries=LLM_RETRIES, pool_size=LLM_POOL_SIZE,
+)
+llmClient = LLMClient(LLM_ENDPOINT, OLLAMA_MODEL, **llm_settings)
+router = Router(FAQ_URL, ROUTER_FAQ_MIN_SCORE, ROUTER_VECTOR_MIN_SIM)
+rebuildWorker = RebuildWorker(rebuild, jobs_dir=os.path.join(INDEX_PATH, 'jobs'))
+liveSync = None
+if SYNC_MONGO_URI:
+    liveSync = LiveSync(
+        SYNC_MONGO_URI, SYNC_DB, SYNC_COLLECTION,
+        publish=assign,
+        encode=lambda texts: model.encode(texts, convert_to_numpy=True),
+        compact=compact_overlay,
+        mode=SYNC_MODE, batch_size=SYNC_BATCH_SIZE, batch_wait=SYNC_BATCH_WAIT_MS / 1000,
+        poll_interval=SYNC_POLL_SECONDS, reconcile_every=SYNC_RECONCILE_SECONDS,
+        compact_after=SYNC_COMPACT_AFTER,
+    )
+llmLoop = LLMEventLoop(lambda: AsyncLLMClient(LLM_ENDPOINT, OLLAMA_MODEL, **llm_settings))
+
+def run_tool(name, args):
+    if name == "book_search":
+        return book_search_message(args["query"], args.get("numberOfBooks", 5))
+    raise ValueError(f"Unknown tool {name}")
+
+def call_llm(messages, tools, stream=False):
+    if LLM_ASYNC:
+        # The LLM calls run on the shared loop, but this request thread waits for all of them.
+        # Worst case: a search round plus an answer round, each with its retries
+        timeout = 2 * (LLM_RETRIES + 1) * (LLM_CONNECT_TIMEOUT + LLM_READ_TIMEOUT)
+        try:
+            return llmLoop.run(run_chat_async, messages, tools, run_tool, timeout=timeout)
+        except TimeoutError:
+            LLM_ROUNDS.labels("timeout").inc()
+            print("LLM chat timed out", flush=True)
+            return messages
+    return run_chat(llmClient, messages, tools, run_tool)
+
+def stream_llm(messages, tools):
+    """
+    Streaming variant of call_llm. Reads Ollama's NDJSON stream and yields
+    Server-Sent Events: `token` for each piece of reply text, `tool` when a
+    book_search runs, `done` with the final message list, or `error`.
+    """
     try:
-        llm_response = requests.post(
-            LLM_ENDPOINT,
-            headers={"Content-Type": "application/json"},
-            json={
-                "model": OLLAMA_MODEL,
-                "messages": messages,
-                "tools": tools,
-                "stream": stream,
-            },
-        )
-        llm_response.raise_for_status()
-        data = llm_response.json()
-    except Exception as e:
-        print(f"Error contacting LLM: {e}", flush=True)
-        return messages
-
-    print(json.dumps(data, indent=4), flush=True)
-
-    assistant_msg = data.get("message", {})
-    messages.append(assistant_msg)
-
-    # --- Handle tool calls ---
-    if "tool_calls" in assistant_msg:
-        for call in assistant_msg["tool_calls"]:
-            func_name = call["function"]["name"]
-            args = call["function"].get("arguments", {})
-
-            # --- Book search tool ---
-            if func_name == "book_search":
-                query = args.get("query")
-                num_books = args.get("numberOfBooks", 5)
-
-                if query:
-                    tool_result = faiss_search(query, num_books)
-                    print("Book_Search called:", query, flush=True)
-
-                    # Format output for readability
-                    tool_output = [
-                        f"{r['title']} by {r['authors']} "
-                        f"(Genres: {r['genres']}, ISBN: {r['isbn']}, "
-                        f"Release Date: {r['release_date']}, "
-                        f"Standard Price: ${r['std_price']}, Sale Price: ${r['sale_price']}, Stock: {r['stock_count']})"
-                        for r in tool_result
-                    ]
-                    print("Results:", json.dumps(tool_output, indent=2), flush=True)
-
-                    # Append tool result
-                    messages.append({
-                        "role": "tool",
-                        "content": "\n".join(tool_output),
-                        "tool_name": "book_search"
-                    })
-
-                    # Recurse with the reply tool
-                    return call_llm(messages, [tools[1]], stream)
-
-            # --- Reply tool ---
-            elif func_name == "reply":
-                reply_text = args.get("reply", "")
+        # A book_search round is followed by one answer round
+        for _ in range(3):
+            think = ThinkFilter()
+            content = ""
+            tool_calls = []
+            # The round includes the time the client takes to read its tokens
+            with span("llm"), llmClient.stream(messages, tools) as llm_response:
+                for chunk in iter_ndjson(llm_response):
+                    message = chunk.get("message", {})
+                    tool_calls.extend(message.get("tool_calls", []))
+                    text = think.feed(message.get("content", ""))
+                    if text:
+                        content += text
+                        yield sse("token", {"content": text})
+                    if chunk.get("done"):
+                        break
+            LLM_ROUNDS.labels("ok").inc()
+            text = think.flush()
+            if text:
+                content += text
+                yield sse("token", {"content": text})
+
+            assistant_msg = {"role": "assistant", "content": content}
+            if tool_calls:
+                assistant_msg["tool_calls"] = tool_calls
+            messages.append(assistant_msg)
+
+            calls = {call["function"]["name"]: call["function"].get("arguments", {}) for call in tool_calls}
+            search_args = calls.get("book_search", {})
+            if search_args.get("query"):
+                yield sse("tool", {"name": "book_search", "query": search_args["query"]})
+                messages.append(book_search_message(search_args["query"], search_args.get("numberOfBooks", 5)))
+                # Answer without tools so the reply streams as content tokens
+                tools = []
+                continue
+
+            if "reply" in calls:
+                # Tool arguments arrive whole, so the reply tool can only be sent as one token
+                reply_text = calls["reply"].get("reply", "")
                 messages.append({"role": "assistant", "content": reply_text})
-                print("Reply added:", reply_text, flush=True)
-                return messages
-
-    # --- No tool calls; standard assistant reply ---
-    else:
-        reply = assistant_msg.get("content", "")
-        if "{" in reply:
-            # Remove hidden reasoning if present
-            reply = reply.split("}", 1)[-1].strip()
+                yield sse("token", {"content": reply_text})
+            debug_log("Final reply:", messages[-1]["content"])
+            break
 
-        messages.append({"role": "assistant", "content": reply})
-        print("Final reply:", reply, flush=True)
-        return messages
+        yield sse("done", messages)
+    except Exception as e:
+        LLM_ROUNDS.labels("error").inc()
+        print(f"Error streaming from LLM: {e}", flush=True)
+        yield sse("error", {"error": "Error contacting LLM"})
 
 
 
 #Routes
 
+@app.before_request
+def pick_up_snapshot():
+    g.request_start = time.perf_counter()
+    snapshotWatcher.check(snapshot.name if snapshot else None)
+
+@app.after_request
+def time_request(response):
+    # Streamed chat replies are timed to their headers, the LLM rounds behind them are in chat_stage_seconds
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_SECONDS.labels(request.method, route, response.status_code).observe(time.perf_counter() - g.request_start)
+    return response
+
 @app.route("/rebuild_index", methods=["POST"])
 def rebuild_index_api():
-    build_index()  # rebuild and reload immediately
-    return jsonify({"status": "index rebuilt"})
+    data = request.get_json(silent=True) or {}
+    # Rebuilds run in the background, poll the returned job for the outcome
+    job = rebuildWorker.submit(full=bool(data.get("full", False)))
+    return jsonify(job), 202, {"Location": f"/rebuild_index/{job['id']}"}
+
+@app.route("/rebuild_index/<job_id>", methods=["GET"])
+def rebuild_job_api(job_id):
+    job = rebuildWorker.job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route("/ready", methods=["GET"])
+def ready_api():
+    snap = snapshot
+    status = {"ready": snap is not None, "rebuilding": rebuildWorker.running()}
+    if snap is None:
+        return jsonify(status), 503
+    # Serving goes on when live sync fails, its last error and staleness show up here
+    live = liveSync.stats() if liveSync is not None else None
+    return jsonify({**status, "snapshot": snap.describe(), "live_sync": live})
+
+#Typeahead for the search page: titles, authors and ISBNs starting with q, in-stock books first
+@app.route("/autocomplete", methods=["GET"])
+def autocomplete_api():
+    snap = snapshot
+    if snap is None:
+        return jsonify({"error": "Index not ready"}), 503
+    try:
+        k = min(max(int(request.args.get("k", AUTOCOMPLETE_K)), 1), AUTOCOMPLETE_MAX_K)
+    except ValueError:
+        return jsonify({"error": "k must be a number"}), 400
+    query = request.args.get("q", "")[:200]
+    return jsonify({"query": query, "suggestions": snap.autocomplete(query, k)})
 
 #Temporary API to test the faiss search
 @app.route("/search", methods=["POST"])
@@ -206,11 +584,49 @@ def search_api():
     data = request.json or {}
     query = data.get("query", "")
     k = data.get("k", 5)
+    mode = data.get("mode", SEARCH_MODE)
     if not query:
         return jsonify({"error": "No query provided"}), 400
-    response = faiss_search(query, k)
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    if snapshot is None:
+        return jsonify({"error": "Index not ready"}), 503
+    response = faiss_search(query, k, data.get("nprobe"), data.get("ef_search"), mode)
     return jsonify(response)
 
+#Prometheus histograms and counters, see metrics.py
+@app.route("/metrics", methods=["GET"])
+def metrics_api():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route("/stats", methods=["GET"])
+def stats_api():
+    return jsonify({
+        "query_cache": queryCache.stats(),
+        "search_batcher": searchBatcher.stats(),
+        "router": router.stats(),
+        "sessions": sessionStore.stats(),
+        "response_cache": responseCache.stats(),
+        "result_cache": resultCache.stats(),
+        "snapshot": snapshot.describe() if snapshot is not None else None,
+        "snapshot_reloads": snapshotWatcher.reloads,
+        "live_sync": liveSync.stats() if liveSync is not None else None,
+        "pid": os.getpid(),
+    })
+
+def finish_chat(session_id, messages, prompt_length, cache_key=None):
+    sessionStore.save(session_id, messages)
+    # Only complete answers from the LLM are worth reusing
+    reply = messages[prompt_length:]
+    if cache_key is not None and reply and reply[-1].get("role") == "assistant" and reply[-1].get("content"):
+        responseCache.put(cache_key, reply)
+
+def finish_after(events, *args):
+    # stream_llm fills in messages as it goes, finish once the reply is complete
+    yield from events
+    finish_chat(*args)
+
 @app.route("/chat", methods=["POST"])
 def llm_chat():
     req_data = request.json or {}
@@ -218,6 +634,11 @@ def llm_chat():
     history = req_data.get("history", False)
     if not user_message:
         return jsonify({"error": "No message provided"})
+    #Clients send a session id and the history is kept here (sending the full history still works)
+    session_id = req_data.get("session_id") or SessionStore.new_id()
+    if not history:
+        history = sessionStore.get(session_id)
+    first_turn = not history
     if not history:
         messages = [
             {
@@ -238,6 +659,7 @@ def llm_chat():
             }
         ]
     else:
+        history = compact_history(history, HISTORY_TOKEN_BUDGET, HISTORY_KEEP_TURNS)
         messages = history + [{'role': 'user', 'content': user_message }]
     
     tools=[{
@@ -281,18 +703,56 @@ def llm_chat():
         }
     ]
     
-    return jsonify(call_llm(messages, tools, False))
+    stream = req_data.get("stream")
+    prompt_length = len(messages)
+
+    #Answers that skip the LLM: the semantic cache for opening questions, then the router
+    cache_key = embed_query(user_message) if first_turn and RESPONSE_CACHE_SIZE > 0 else None
+    answered_by = None
+    cached = responseCache.get(cache_key) if cache_key is not None else None
+    if cached is not None:
+        answered_by, cache_key = "response cache", None
+        messages += [dict(m) for m in cached]
+    elif ROUTER_ENABLED and first_turn and snapshot is not None:
+        # Follow-ups ("it", "the second one") only make sense with the conversation, leave them to the LLM
+        snap = snapshot
+        routed = router.route(user_message, snap.catalog, lambda text: top_hit(snap, text))
+        if routed:
+            answered_by, cache_key = f"{routed[0]} route", None
+            messages.append({"role": "assistant", "content": routed[1]})
+    if answered_by:
+        debug_log(f"Answered by {answered_by}:", messages[-1]["content"])
+
+    if not stream:
+        if not answered_by:
+            messages = call_llm(messages, tools, False)
+        finish_chat(session_id, messages, prompt_length, cache_key)
+        return jsonify(messages), {"X-Session-Id": session_id}
+
+    if answered_by:
+        events = iter([sse("token", {"content": messages[-1]["content"]}), sse("done", messages)])
+    else:
+        events = stream_llm(messages, tools)
+    # X-Accel-Buffering stops the nginx /api/ proxy from holding back events
+    return Response(
+        stream_with_context(finish_after(events, session_id, messages, prompt_length, cache_key)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id},
+    )
     # updated_messages = call_llm(messages, tools, False)
     
     
     
     
+def start():
+    # Load existing index if it exists, otherwise build it in the background (/ready says when it is up)
+    if snapshot is None and not load_snapshot():
+        rebuildWorker.submit(full=False, if_missing=True)
+    if liveSync is not None:
+        liveSync.start()
+
 if __name__ == "__main__":
-    # Load existing index if it exists
-    if os.path.exists(INDEX_PATH + '/' + INDEX_NAME) and os.path.exists(INDEX_PATH + "/" + DATAFRAME_NAME):
-        load_index()
-        load_data()
-    else:
-        build_index()
+    #Development server, see gunicorn.conf.py for serving with several worker processes
+    start()
 
     app.run(host="0.0.0.0", port=5050)
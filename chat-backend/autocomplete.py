@@ -0,0 +1,215 @@
+import os
+import re
+import threading
+import numpy as np
+from catalog import normalize_isbn, normalize_title
+
+# Typeahead over titles, authors and ISBNs.
+#
+# Every title and author contributes one key per word start ("harry potter",
+# "potter"), every ISBN its digits. Keys are utf-8 bytes cut to KEY_BYTES and
+# sorted in one fixed-width array, so the entries starting with a prefix are
+# one contiguous range found by two binary searches. Each entry carries its
+# catalog row and a precomputed rank (stock, and whether the key starts the
+# title or name), and the best entries for every one- and two-character
+# prefix are kept aside, because those ranges cover most of the catalog.
+
+KEY_BYTES = 24
+KINDS = ["title", "author", "isbn"]
+TITLE, AUTHOR, ISBN = range(3)
+TOP_PREFIX_LEN = 2
+TOP_PER_PREFIX = 64
+ISBN_QUERY_RE = re.compile(r"^[\d\s-]{3,}[\dXx]?$")
+
+
+def split_authors(authors) -> list:
+    return [a.strip() for a in str(authors).split(",") if a.strip()] if authors else []
+
+
+def word_starts(text):
+    """Every suffix of the normalized text that starts a word, first word first."""
+    words = normalize_title(text).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def stock_of(book) -> float:
+    try:
+        return max(float(book.get("stock_count") or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PrefixIndex:
+    """
+    Sorted prefix keys over a Catalog's rows. Arrays can be saved with a
+    snapshot and memory-mapped; the small top table is built on first use.
+    """
+
+    def __init__(self, keys, rows, kinds, ranks):
+        self.keys = keys
+        self.rows = rows
+        self.kinds = kinds
+        self.ranks = ranks
+        self._top = None
+        self._top_lock = threading.Lock()
+
+    @classmethod
+    def build(cls, books):
+        """books: iterable of dicts with title, authors, isbn and stock_count, one per catalog row."""
+        keys, rows, kinds, ranks = [], [], [], []
+
+        def add(key, row, kind, rank):
+            if key:
+                keys.append(key.encode("utf-8")[:KEY_BYTES])
+                rows.append(row)
+                kinds.append(kind)
+                ranks.append(rank)
+
+        for row, book in enumerate(books):
+            # In-stock books first, then by how many are in stock; the start of a title beats a word inside it
+            popularity = np.log1p(stock_of(book)) + (10.0 if stock_of(book) > 0 else 0.0)
+            for i, key in enumerate(word_starts(book.get("title"))):
+                add(key, row, TITLE, popularity + (1.0 if i == 0 else 0.0))
+            for author in split_authors(book.get("authors")):
+                for i, key in enumerate(word_starts(author)):
+                    add(key, row, AUTHOR, popularity + (0.5 if i == 0 else 0.0))
+            add(normalize_isbn(book.get("isbn") or ""), row, ISBN, popularity)
+
+        keys = np.asarray(keys, dtype=f"S{KEY_BYTES}")
+        order = np.argsort(keys, kind="stable")
+        return cls(
+            keys[order],
+            np.asarray(rows, dtype="int32")[order],
+            np.asarray(kinds, dtype="int8")[order],
+            np.asarray(ranks, dtype="float32")[order],
+        )
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        fields = ["title", "authors", "isbn", "stock_count"]
+        columns = [catalog.columns[f] if f in catalog.columns else [None] * len(catalog) for f in fields]
+        return cls.build(dict(zip(fields, values)) for values in zip(*columns))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _range(self, prefix: bytes):
+        lo = int(np.searchsorted(self.keys, prefix, side="left"))
+        if len(prefix) >= KEY_BYTES:
+            # Keys are cut to KEY_BYTES, so the ones starting with a full-length prefix equal it.
+            # A longer search value would make NumPy copy the whole array to a wider dtype.
+            return lo, int(np.searchsorted(self.keys, prefix, side="right"))
+        # 0xff never occurs in utf-8, so this sorts after every key starting with prefix
+        hi = int(np.searchsorted(self.keys, prefix + b"\xff", side="left"))
+        return lo, hi
+
+    def _best(self, lo, hi, limit):
+        if hi - lo <= limit:
+            return lo + np.argsort(-self.ranks[lo:hi], kind="stable")
+        top = np.argpartition(-self.ranks[lo:hi], limit - 1)[:limit]
+        return lo + top[np.argsort(-self.ranks[lo:hi][top], kind="stable")]
+
+    def _top_table(self):
+        if self._top is None:
+            with self._top_lock:
+                if self._top is None:
+                    top = {}
+                    for n in range(1, TOP_PREFIX_LEN + 1):
+                        # astype cuts every key to its first n bytes
+                        for prefix in np.unique(self.keys.astype(f"S{n}")).tolist():
+                            if prefix:
+                                top[prefix] = self._best(*self._range(prefix), TOP_PER_PREFIX)
+                    self._top = top
+        return self._top
+
+    def entries(self, prefix: str, limit: int):
+        """Entry positions whose key starts with prefix, best ranked first, at most `limit` (before dedupe)."""
+        key = prefix.encode("utf-8")
+        if not key:
+            return np.empty(0, dtype="int64")
+        if len(key) <= TOP_PREFIX_LEN and limit <= TOP_PER_PREFIX:
+            return self._top_table().get(key, np.empty(0, dtype="int64"))[:limit]
+        lo, hi = self._range(key[:KEY_BYTES])
+        return self._best(lo, hi, min(limit, hi - lo)) if hi > lo else np.empty(0, dtype="int64")
+
+    def save(self, path):
+        np.save(os.path.join(path, "prefix.keys.npy"), self.keys)
+        np.save(os.path.join(path, "prefix.rows.npy"), self.rows)
+        np.save(os.path.join(path, "prefix.kinds.npy"), self.kinds)
+        np.save(os.path.join(path, "prefix.ranks.npy"), self.ranks)
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Returns None for snapshots written without a prefix index."""
+        if not os.path.exists(os.path.join(path, "prefix.keys.npy")):
+            return None
+        mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(path, f"prefix.{name}.npy"), mmap_mode=mode) for name in ("keys", "rows", "kinds", "ranks")))
+
+
+def suggestion(kind, book, query):
+    if kind == AUTHOR:
+        # The author of this book whose name matched
+        name = next((a for a in split_authors(book.get("authors")) if any(k.startswith(query) for k in word_starts(a))), None)
+        return ("author", normalize_title(name)), {"kind": "author", "text": name}
+    return ("book", book.get("isbn"), book.get("title")), {
+        "kind": KINDS[kind],
+        "text": book.get("title"),
+        "authors": book.get("authors"),
+        "isbn": book.get("isbn"),
+    }
+
+
+def complete(sources, prefix: str, k: int):
+    """
+    Up to k suggestions for prefix: books for title and ISBN matches, author
+    names for author matches, each listed once. sources are (catalog,
+    PrefixIndex, catalog ids to leave out or None) - one per snapshot, or a
+    base snapshot and its live-sync changes.
+    """
+    isbn = ISBN_QUERY_RE.match(prefix.strip())
+    query = normalize_isbn(prefix) if isbn else normalize_title(prefix)
+    if not query:
+        return []
+    candidates = []
+    for source, (catalog, index, hidden) in enumerate(sources):
+        # Over-fetch: several entries of one book or author collapse into one suggestion
+        found = index.entries(query, k * 4)
+        if not len(found):
+            continue
+        rows = np.asarray(index.rows[found], dtype="int64")
+        keep = np.ones(len(found), dtype=bool)
+        if hidden is not None and len(hidden):
+            keep = ~np.isin(np.asarray(catalog.ids[rows], dtype="int64"), hidden)
+        found = found[keep]
+        for rank, key, kind, row in zip(index.ranks[found].tolist(), index.keys[found].tolist(), index.kinds[found].tolist(), rows[keep].tolist()):
+            # Equal ranks: the shorter key is the closer match
+            candidates.append((-rank, len(key), kind, source, row, key))
+    candidates.sort()
+
+    # Rows are only decoded until k suggestions are found
+    seen, results = set(), []
+    for _, _, kind, source, row, key in candidates:
+        # The same key means the same author name, the same row the same book
+        entry = (kind, key) if kind == AUTHOR else (source, row)
+        if entry in seen:
+            continue
+        seen.add(entry)
+        book = sources[source][0].gather([row], ["title", "authors", "isbn"])[0]
+        # Keys are cut to KEY_BYTES, longer queries are checked against the whole text
+        if len(query.encode("utf-8")) > KEY_BYTES and not matches(kind, book, query):
+            continue
+        key, item = suggestion(kind, book, query)
+        if key not in seen and item["text"]:
+            seen.add(key)
+            results.append(item)
+            if len(results) == k:
+                break
+    return results
+
+
+def matches(kind, book, query) -> bool:
+    if kind == ISBN:
+        return normalize_isbn(book.get("isbn") or "").startswith(query)
+    texts = [book.get("title")] if kind == TITLE else split_authors(book.get("authors"))
+    return any(key.startswith(query) for text in texts for key in word_starts(text))
@@ -0,0 +1,66 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from per_process import PerProcess
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent request threads and passes them to
+    `handler` as a single list. A batch closes when it holds max_batch items or
+    max_wait seconds after its first item arrived. `handler` must return one
+    result per item, in order; each caller gets its own result back.
+    """
+
+    def __init__(self, handler, max_batch: int = 16, max_wait: float = 0.002):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = PerProcess(self._start)
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    def submit(self, item):
+        future = Future()
+        self._queue.get().put((item, future))
+        return future.result()
+
+    def _start(self):
+        pending = queue.Queue()
+        threading.Thread(target=self._run, args=(pending,), name="micro-batcher", daemon=True).start()
+        return pending
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            try:
+                results = self.handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "largest": self.largest,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
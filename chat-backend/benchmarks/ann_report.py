@@ -0,0 +1,101 @@
+"""
+Recall-vs-latency report for the FAISS index kinds in index_factory.py.
+
+Uses the vectors in the embedding store (INDEX_PATH/EMBEDDINGS_NAME) when it
+exists, otherwise a synthetic catalog. Queries are perturbed catalog vectors
+and the exact flat index is the ground truth.
+
+    python benchmarks/ann_report.py
+    python benchmarks/ann_report.py --synthetic 200000 --queries 500 -k 10
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import index_factory  # noqa: E402
+from embedding_store import EmbeddingStore  # noqa: E402
+
+NPROBE_SWEEP = [1, 2, 4, 8, 16, 32, 64, 128]
+EF_SEARCH_SWEEP = [16, 32, 64, 128, 256]
+
+
+def load_vectors(args):
+    path = os.path.join(os.getenv("INDEX_PATH", "./data"), os.getenv("EMBEDDINGS_NAME", "embeddings.npz"))
+    if not args.synthetic and os.path.exists(path):
+        store = EmbeddingStore.load(path, os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2"))
+        if len(store):
+            print(f"Using {len(store)} vectors from {path}")
+            return store.vectors, store.ids
+    n = args.synthetic or 50000
+    print(f"Using {n} synthetic {args.dim}-d vectors")
+    rng = np.random.default_rng(0)
+    # Clustered data behaves more like real embeddings than uniform noise
+    centers = rng.standard_normal((max(1, n // 500), args.dim)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, args.dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, np.arange(n, dtype="int64")
+
+
+def make_queries(vectors, count, rng):
+    picks = vectors[rng.integers(0, len(vectors), count)]
+    queries = picks + 0.05 * rng.standard_normal(picks.shape).astype("float32")
+    return np.ascontiguousarray(queries / np.linalg.norm(queries, axis=1, keepdims=True), dtype="float32")
+
+
+def run(index, queries, truth, k, params=None):
+    # One query per call, like faiss_search does
+    latencies = []
+    hits = 0
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, I = index.search(q[None, :], k, params=params)
+        latencies.append(time.perf_counter() - start)
+        hits += len(np.intersect1d(I[0], expected))
+    latencies = np.array(latencies) * 1000
+    return hits / truth.size, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=0, help="ignore the embedding store, use N random vectors")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--types", default=",".join(index_factory.INDEX_TYPES))
+    args = parser.parse_args()
+
+    vectors, ids = load_vectors(args)
+    queries = make_queries(vectors, args.queries, np.random.default_rng(1))
+
+    exact = index_factory.build("flat", vectors, ids)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"\n| index | build s | knob | recall@{args.k} | p50 ms | p95 ms |")
+    print("|---|---|---|---|---|---|")
+    for kind in args.types.split(","):
+        used = index_factory.resolve_kind(kind, len(vectors))
+        if used != kind:
+            print(f"| {kind} | skipped, catalog too small | | | | |")
+            continue
+        start = time.perf_counter()
+        index = index_factory.build(kind, vectors, ids)
+        build_s = time.perf_counter() - start
+
+        if kind in ("ivf", "ivfpq"):
+            nlist = index_factory.unwrap(index).nlist
+            knobs = [(f"nprobe={p}", index_factory.search_params(index, nprobe=p)) for p in NPROBE_SWEEP if p <= nlist]
+        elif kind == "hnsw":
+            knobs = [(f"efSearch={e}", index_factory.search_params(index, ef_search=e)) for e in EF_SEARCH_SWEEP]
+        else:
+            knobs = [("-", None)]
+
+        for label, params in knobs:
+            recall, p50, p95 = run(index, queries, truth, args.k, params)
+            print(f"| {kind} | {build_s:.2f} | {label} | {recall:.3f} | {p50:.3f} | {p95:.3f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Microbenchmark: turning FAISS hits into result dicts.
+
+Compares the previous faiss_search path (20 + k over-fetch, DataFrame.iloc
+per hit, dict per row, `row not in results` dedupe) with Catalog.lookup on
+a synthetic catalog that contains duplicate books.
+
+    python benchmarks/catalog_bench.py --books 100000 -k 5
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from catalog import Catalog, FIELDS  # noqa: E402
+
+
+def synthetic_books(n, rng):
+    numbers = rng.integers(0, int(n * 0.9), n)  # plenty of repeated books
+    return pd.DataFrame({
+        "title": [f"Title {i}" for i in numbers],
+        "authors": [f"Author {i % 5000}" for i in numbers],
+        "genres": rng.choice(["Fantasy", "Mystery", "Romance", "Sci-Fi"], n),
+        "isbn": [str(9780000000000 + i) for i in range(n)],
+        "release_date": "2020-01-01",
+        "std_price": rng.uniform(5, 40, n).round(2),
+        "sale_price": rng.uniform(3, 30, n).round(2),
+        "stock_count": rng.integers(0, 50, n),
+    })
+
+
+def legacy_lookup(dataFrame, locations, k):
+    results = []
+    for location in locations:
+        row = dataFrame.iloc[location]
+        row = {field: row[field] for field in FIELDS}
+        if row not in results:
+            results.append(row)
+        if len(results) >= 2 and len(results) >= k:
+            break
+    return results
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for args in runs:
+        fn(*args)
+    return (time.perf_counter() - start) / len(runs) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    dataFrame = synthetic_books(args.books, rng)
+    # Same keying as build_index: one vector id per (title, authors)
+    dataFrame["vector_id"] = pd.factorize(dataFrame["title"] + " by " + dataFrame["authors"])[0].astype("int64")
+
+    start = time.perf_counter()
+    catalog = Catalog.from_dataframe(dataFrame)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # The old index had one vector per row and over-fetched 20 + k rows
+    legacy_runs = [(dataFrame, rng.integers(0, len(dataFrame), 20 + args.k), args.k) for _ in range(args.queries)]
+    catalog_runs = [(rng.choice(catalog.ids, max(2, args.k)),) for _ in range(args.queries)]
+
+    legacy_us = timed(legacy_lookup, legacy_runs)
+    catalog_us = timed(catalog.lookup, catalog_runs)
+
+    print(f"{args.books} rows, {len(catalog)} distinct books, catalog built in {build_ms:.1f} ms")
+    print(f"legacy iloc path : {legacy_us:9.1f} us/query")
+    print(f"Catalog.lookup   : {catalog_us:9.1f} us/query  ({legacy_us / catalog_us:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
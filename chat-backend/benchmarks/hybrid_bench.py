@@ -0,0 +1,122 @@
+"""
+Latency and recall of the three search modes (vector, lexical, hybrid).
+
+Uses the current snapshot in INDEX_PATH when there is one, otherwise a
+synthetic catalog embedded with EMBED_MODEL. Query sets, each with the
+book it should find:
+
+  title     the exact title
+  keywords  a few words of the title plus the author, lowercased and shuffled
+  typo      the title with one character dropped per word
+
+Latency includes encoding the query, as in faiss_search.
+
+    python benchmarks/hybrid_bench.py --books 20000 --queries 300 -k 5
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import index_factory  # noqa: E402
+from catalog import Catalog  # noqa: E402
+from lexical import BM25Index, rrf, tokenize  # noqa: E402
+from snapshot import Snapshot, open_snapshot, write_snapshot  # noqa: E402
+from embedding_store import content_id  # noqa: E402
+
+WORDS = (
+    "shadow river night garden silver winter queen secret stone empire last city fire "
+    "glass house storm daughter kingdom ocean memory wolf crown summer light iron song "
+    "forest dark star bone mirror letter island journey ghost blood paper golden thief"
+).split()
+
+
+def synthetic_snapshot(n, model, rng):
+    import pandas as pd
+    titles = [" ".join(rng.choice(WORDS, rng.integers(2, 6)).tolist()).title() for _ in range(n)]
+    authors = [f"{rng.choice(['Anna', 'Ben', 'Clara', 'David', 'Elena'])} {rng.choice(WORDS).title()}son" for _ in range(n)]
+    books = pd.DataFrame({"title": titles, "authors": authors, "genres": rng.choice(["Fantasy", "Mystery", "Romance"], n)})
+    texts = [f"{t} by {a}" for t, a in zip(titles, authors)]
+    books["vector_id"] = [content_id(text) for text in texts]
+    vectors = model.encode(texts, batch_size=256, convert_to_numpy=True).astype("float32")
+    index = index_factory.build(index_factory.resolve_kind("flat", n), vectors, books["vector_id"].to_numpy())
+    return Snapshot(index, Catalog.from_dataframe(books))
+
+
+def make_queries(snap, count, rng):
+    picks = rng.choice(len(snap.catalog), min(count, len(snap.catalog)), replace=False)
+    books = snap.catalog.gather(picks, ["title", "authors"])
+    ids = np.asarray(snap.catalog.ids[picks]).tolist()
+    sets = {"title": [], "keywords": [], "typo": []}
+    for book, target in zip(books, ids):
+        title, authors = str(book["title"]), str(book["authors"])
+        sets["title"].append((title, target))
+        words = tokenize(title)
+        chosen = list(rng.choice(words, min(2, len(words)), replace=False)) + tokenize(authors)[-1:]
+        rng.shuffle(chosen)
+        sets["keywords"].append((" ".join(chosen), target))
+        typo = " ".join(w[:-1] if len(w) > 3 else w for w in title.split())
+        sets["typo"].append((typo, target))
+    return sets
+
+
+def search(snap, model, query, k, mode, depth):
+    if mode == "lexical":
+        return snap.lexical_search(query, k)[1].tolist()
+    vector = model.encode([query], convert_to_numpy=True).astype("float32")
+    if mode == "vector":
+        return snap.search(vector, k)[1][0].tolist()
+    _, vector_ids = snap.search(vector, max(k, depth))
+    _, lexical_ids = snap.lexical_search(query, max(k, depth))
+    return rrf([vector_ids[0].tolist(), lexical_ids.tolist()], k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20000, help="size of the synthetic catalog")
+    parser.add_argument("--synthetic", action="store_true", help="ignore the snapshot in INDEX_PATH")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--depth", type=int, default=int(os.getenv("HYBRID_CANDIDATES", "50")))
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2"))
+    rng = np.random.default_rng(0)
+
+    snap = None if args.synthetic else open_snapshot(os.getenv("INDEX_PATH", "./data"))
+    if snap is not None:
+        print(f"Using snapshot {snap.name} ({len(snap.catalog)} books)")
+    else:
+        print(f"Embedding {args.books} synthetic books...")
+        with tempfile.TemporaryDirectory() as path:
+            # Written and reopened, so the BM25 index is the one saved with a snapshot
+            snap = open_snapshot(path, write_snapshot(path, synthetic_snapshot(args.books, model, rng)), mmap=False)
+
+    start = time.perf_counter()
+    BM25Index.from_catalog(snap.catalog)
+    print(f"BM25 index built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    print(f"\n| queries | mode | hit@{args.k} | MRR | p50 ms | p95 ms |")
+    print("|---|---|---|---|---|---|")
+    for name, queries in make_queries(snap, args.queries, rng).items():
+        for mode in ("vector", "lexical", "hybrid"):
+            latencies, hits, reciprocal = [], 0, 0.0
+            for query, target in queries:
+                start = time.perf_counter()
+                ids = search(snap, model, query, args.k, mode, args.depth)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if target in ids:
+                    hits += 1
+                    reciprocal += 1 / (ids.index(target) + 1)
+            print(
+                f"| {name} | {mode} | {hits / len(queries):.3f} | {reciprocal / len(queries):.3f} "
+                f"| {np.percentile(latencies, 50):.2f} | {np.percentile(latencies, 95):.2f} |"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Startup benchmark: loading the index and catalog in a fresh process.
+
+Compares the previous startup path (faiss.read_index + pd.read_pickle +
+Catalog.from_dataframe) with opening a memory-mapped snapshot directory.
+Each load runs in its own subprocess; the table shows the load time and the
+resident memory afterwards, split into private (RssAnon) and file-backed
+pages (RssFile), which the page cache shares between processes.
+
+    python benchmarks/snapshot_bench.py --books 200000 --dim 384 --type flat
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import faiss  # noqa: E402
+import pandas as pd  # noqa: E402
+import index_factory  # noqa: E402
+from catalog import Catalog  # noqa: E402
+from snapshot import Snapshot, write_snapshot, open_snapshot  # noqa: E402
+from catalog_bench import synthetic_books  # noqa: E402
+
+
+def rss_mb() -> dict:
+    usage = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                usage[key] = int(value.split()[0]) / 1024
+    return usage
+
+
+def load(mode, path, queries):
+    before = rss_mb()
+    start = time.perf_counter()
+    if mode == "pickle":
+        index = faiss.read_index(os.path.join(path, "faiss.index"))
+        catalog = Catalog.from_dataframe(pd.read_pickle(os.path.join(path, "books.pkl")))
+    else:
+        snap = open_snapshot(path)
+        index, catalog = snap.index, snap.catalog
+    load_ms = (time.perf_counter() - start) * 1000
+
+    # First searches fault in the pages a real worker would touch
+    start = time.perf_counter()
+    _, ids = index.search(queries, 5)
+    for row in ids:
+        catalog.lookup(row)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    after = rss_mb()
+    return {
+        "load_ms": load_ms,
+        "first_search_ms": first_ms,
+        "rss_mb": after["VmRSS"] - before["VmRSS"],
+        "private_mb": after["RssAnon"] - before["RssAnon"],
+        "shared_mb": after["RssFile"] - before["RssFile"],
+    }
+
+
+def prepare(path, n, dim, kind, rng):
+    books = synthetic_books(n, rng)
+    books["vector_id"] = np.arange(n, dtype="int64")
+    vectors = rng.standard_normal((n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = index_factory.build(index_factory.resolve_kind(kind, n), vectors, books["vector_id"].to_numpy())
+
+    books.to_pickle(os.path.join(path, "books.pkl"))
+    faiss.write_index(index, os.path.join(path, "faiss.index"))
+    write_snapshot(path, Snapshot(index, Catalog.from_dataframe(books)))
+    return vectors[rng.integers(0, n, 20)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--type", default="flat", choices=index_factory.INDEX_TYPES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--load", choices=["pickle", "snapshot"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        queries = np.load(os.path.join(args.dir, "queries.npy"))
+        print(json.dumps(load(args.load, args.dir, queries)))
+        return
+
+    with tempfile.TemporaryDirectory() as path:
+        print(f"Writing {args.books} books ({args.type}, dim {args.dim}) to {path}...")
+        np.save(os.path.join(path, "queries.npy"), prepare(path, args.books, args.dim, args.type, np.random.default_rng(0)))
+
+        print("\n| startup | load ms | first search ms | RSS MB | private MB | shared MB |")
+        print("|---|---|---|---|---|---|")
+        for mode in ("pickle", "snapshot"):
+            runs = []
+            for _ in range(args.repeat):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--load", mode, "--dir", path],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                runs.append(json.loads(out.strip().splitlines()[-1]))
+            best = min(runs, key=lambda run: run["load_ms"])
+            print(
+                f"| {mode} | {best['load_ms']:.1f} | {best['first_search_ms']:.1f} | {best['rss_mb']:.1f} "
+                f"| {best['private_mb']:.1f} | {best['shared_mb']:.1f} |"
+            )
+
+
+if __name__ == "__main__":
+    main()
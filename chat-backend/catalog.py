@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Fields returned for every book by faiss_search and the book_search tool
+FIELDS = ["title", "authors", "genres", "isbn", "release_date", "std_price", "sale_price", "stock_count"]
+
+
+# Shared by the router's exact lookups and the autocomplete keys, so both agree on what matches
+def normalize_isbn(text) -> str:
+    return re.sub(r"[^0-9X]", "", str(text).upper())
+
+
+def normalize_title(text) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", str(text).lower()).split())
+
+
+class PackedColumn:
+    """
+    A column stored as the JSON encoding of each value, concatenated into one
+    byte array plus an array of offsets. Both arrays can be memory-mapped, and
+    only the values that are actually read get decoded.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def pack(cls, values):
+        encoded = [json.dumps(value, default=str).encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype="uint8"))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def value(self, pos):
+        return json.loads(self.data[self.offsets[pos]:self.offsets[pos + 1]].tobytes())
+
+    def __getitem__(self, positions):
+        column = np.empty(len(positions), dtype=object)
+        for i, pos in enumerate(positions):
+            column[i] = self.value(pos)
+        return column
+
+    def __iter__(self):
+        return (self.value(pos) for pos in range(len(self)))
+
+
+class Catalog:
+    """
+    Read-only columnar copy of the books behind the FAISS index.
+
+    Built once per index build: books sharing a vector id (same title and
+    authors) are collapsed, rows are sorted by vector id, and every field is
+    a NumPy column. Turning FAISS ids into result dicts is then one
+    searchsorted plus one fancy-index gather per column.
+    """
+
+    def __init__(self, ids, columns, version=""):
+        self.ids = ids
+        self.columns = columns
+        # Content fingerprint, changes whenever any returned field of any book changes
+        self.version = version
+        self._keys = {}
+
+    @classmethod
+    def from_dataframe(cls, dataFrame):
+        unique = dataFrame.drop_duplicates("vector_id").sort_values("vector_id", kind="stable")
+        columns = {}
+        for field in FIELDS:
+            if field in unique:
+                # Missing values become None rather than NaN, which is not valid JSON, and
+                # tolist() gives plain Python values
+                values = unique[field].astype(object).where(unique[field].notna(), None).tolist()
+            else:
+                values = [None] * len(unique)
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            columns[field] = column
+        present = [field for field in ["vector_id"] + FIELDS if field in unique]
+        rows = pd.util.hash_pandas_object(unique[present].astype(str), index=False)
+        version = hashlib.blake2b(rows.to_numpy().tobytes(), digest_size=8).hexdigest()
+        return cls(unique["vector_id"].to_numpy(dtype="int64"), columns, version)
+
+    def save(self, path):
+        """Writes ids and packed columns as .npy files in the directory `path`."""
+        np.save(os.path.join(path, "ids.npy"), np.asarray(self.ids, dtype="int64"))
+        for field, column in self.columns.items():
+            if not isinstance(column, PackedColumn):
+                column = PackedColumn.pack(column)
+            np.save(os.path.join(path, f"{field}.offsets.npy"), column.offsets)
+            np.save(os.path.join(path, f"{field}.data.npy"), column.data)
+        with open(os.path.join(path, "catalog.json"), "w") as f:
+            json.dump({"version": self.version, "fields": list(self.columns)}, f)
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Reads a catalog written by save(). With mmap the columns stay on disk in the shared page cache."""
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "catalog.json")) as f:
+            meta = json.load(f)
+        columns = {
+            field: PackedColumn(
+                np.load(os.path.join(path, f"{field}.offsets.npy"), mmap_mode=mode),
+                np.load(os.path.join(path, f"{field}.data.npy"), mmap_mode=mode),
+            )
+            for field in meta["fields"]
+        }
+        return cls(np.load(os.path.join(path, "ids.npy"), mmap_mode=mode), columns, meta["version"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, vector_ids):
+        """Row positions for FAISS ids, in order, skipping -1 and unknown ids."""
+        vector_ids = np.asarray(vector_ids, dtype="int64")
+        if not len(self.ids):
+            return vector_ids[:0]
+        pos = np.searchsorted(self.ids, vector_ids)
+        pos[pos >= len(self.ids)] = 0
+        return pos[self.ids[pos] == vector_ids]
+
+    def gather(self, positions, fields=FIELDS):
+        columns = [self.columns[field][positions] for field in fields]
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+    def lookup(self, vector_ids, fields=FIELDS):
+        return self.gather(self.positions(vector_ids), fields)
+
+    def find(self, field, key, normalize):
+        """Row positions whose normalize(field) equals key. The lookup table is built on first use."""
+        table = self._keys.get((field, normalize))
+        if table is None:
+            table = {}
+            for pos, value in enumerate(self.columns[field]):
+                if value is not None:
+                    table.setdefault(normalize(str(value)), []).append(pos)
+            self._keys[(field, normalize)] = table
+        return table.get(key, [])
+
+
+class DocMap:
+    """
+    Mongo _id of every book -> FAISS id of its embedded text, sorted by _id.
+    Several books can share one FAISS id (same title and authors).
+    """
+
+    def __init__(self, doc_ids, vector_ids):
+        self.doc_ids = doc_ids
+        self.vector_ids = vector_ids
+        self._sorted_vector_ids = None
+
+    @classmethod
+    def from_columns(cls, doc_ids, vector_ids):
+        doc_ids = np.asarray([str(doc_id) for doc_id in doc_ids])
+        order = np.argsort(doc_ids, kind="stable")
+        return cls(doc_ids[order], np.asarray(vector_ids, dtype="int64")[order])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def get(self, doc_id):
+        pos = int(np.searchsorted(self.doc_ids, doc_id))
+        if pos < len(self.doc_ids) and self.doc_ids[pos] == doc_id:
+            return int(self.vector_ids[pos])
+        return None
+
+    def count(self, vector_id) -> int:
+        """How many books use this FAISS id."""
+        if self._sorted_vector_ids is None:
+            self._sorted_vector_ids = np.sort(self.vector_ids)
+        ids = self._sorted_vector_ids
+        return int(np.searchsorted(ids, vector_id, side="right") - np.searchsorted(ids, vector_id))
+
+    def save(self, path):
+        np.save(os.path.join(path, "doc_ids.npy"), self.doc_ids)
+        np.save(os.path.join(path, "doc_vector_ids.npy"), self.vector_ids)
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Returns None for snapshots written before books were tracked by _id."""
+        if not os.path.exists(os.path.join(path, "doc_ids.npy")):
+            return None
+        mode = "r" if mmap else None
+        return cls(
+            np.load(os.path.join(path, "doc_ids.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "doc_vector_ids.npy"), mmap_mode=mode),
+        )
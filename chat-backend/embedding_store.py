@@ -0,0 +1,68 @@
+import os
+import hashlib
+import numpy as np
+
+# Persistent map of content hash -> embedding vector.
+#
+# Every book is embedded from a single piece of text (title + authors). The
+# 63-bit hash of that text doubles as the book's FAISS id, so a rebuild only
+# has to encode texts whose hash is not stored yet and can remove stale
+# vectors from an ID-mapped index by id.
+
+
+def content_id(text: str) -> int:
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    # FAISS ids are signed 64-bit, keep them positive (-1 means "no result")
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+class EmbeddingStore:
+    def __init__(self, model_name: str, ids=None, vectors=None):
+        self.model_name = model_name
+        self.ids = np.asarray(ids if ids is not None else [], dtype="int64")
+        self.vectors = vectors
+        self._pos = {int(i): p for p, i in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls, path: str, model_name: str):
+        if not os.path.exists(path):
+            return cls(model_name)
+        with np.load(path, allow_pickle=False) as data:
+            # Vectors from a different model are useless, start over
+            if str(data["model_name"]) != model_name:
+                print(f"Embedding store was built with {data['model_name']}, discarding.", flush=True)
+                return cls(model_name)
+            return cls(model_name, data["ids"], data["vectors"])
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, model_name=np.array(self.model_name), ids=self.ids, vectors=self.vectors)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, vector_id):
+        return int(vector_id) in self._pos
+
+    def get(self, ids):
+        return self.vectors[[self._pos[int(i)] for i in ids]]
+
+    def delta(self, wanted):
+        """Split `wanted` ids into those already stored and those to encode, plus the stored ids no longer wanted."""
+        wanted = np.asarray(wanted, dtype="int64")
+        known = np.fromiter((i in self for i in wanted), dtype=bool, count=len(wanted))
+        return known, np.setdiff1d(self.ids, wanted)
+
+    def update(self, keep_ids, new_ids, new_vectors):
+        """Keep only `keep_ids` from the current store and append the new vectors."""
+        keep_ids = np.asarray(keep_ids, dtype="int64")
+        new_ids = np.asarray(new_ids, dtype="int64")
+        parts = []
+        if len(keep_ids):
+            parts.append(self.get(keep_ids))
+        if len(new_ids):
+            parts.append(np.asarray(new_vectors, dtype="float32"))
+        self.ids = np.concatenate([keep_ids, new_ids])
+        self.vectors = np.concatenate(parts) if parts else None
+        self._pos = {int(i): p for p, i in enumerate(self.ids)}
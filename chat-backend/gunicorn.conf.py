@@ -0,0 +1,41 @@
+import os
+import glob
+import tempfile
+
+# Production serving: `gunicorn -c gunicorn.conf.py wsgi:app`
+#
+# The app (embedding model and the memory-mapped snapshot) is loaded once in
+# the master and forked into WORKERS processes, so encode and index.search
+# run in parallel instead of queueing on one GIL. Workers pick up snapshots
+# rebuilt by any of them through the `current` file, see snapshot.py.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5050')}"
+workers = int(os.getenv('WORKERS', '2'))
+# Threads keep a worker responsive while requests wait on the LLM or stream replies
+worker_class = "gthread"
+threads = int(os.getenv('WORKER_THREADS', '8'))
+timeout = int(os.getenv('WORKER_TIMEOUT', '120'))
+preload_app = True
+
+# Workers write their metrics here and /metrics adds them up (metrics.py). It has
+# to be set before the app imports prometheus_client, and samples of a previous
+# run are removed so they are not added in.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'chat-backend-metrics'))
+os.makedirs(metrics_dir, exist_ok=True)
+for name in glob.glob(os.path.join(metrics_dir, '*.db')):
+    os.remove(name)
+
+if workers > 1 and os.getenv('SESSION_BACKEND', 'memory') == 'memory':
+    print("WORKERS > 1 with SESSION_BACKEND=memory: chat sessions are not shared between workers", flush=True)
+
+
+def post_fork(server, worker):
+    import torch
+    import faiss
+    import app
+
+    # Split the cores between workers instead of every worker using all of them
+    threads_per_worker = int(os.getenv('TORCH_THREADS', '0')) or max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads_per_worker)
+    faiss.omp_set_num_threads(threads_per_worker)
+    app.start()
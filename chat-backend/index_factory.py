@@ -0,0 +1,124 @@
+import math
+import faiss
+import numpy as np
+
+# Builds the FAISS index used by faiss_search.
+#
+#   flat   exact brute-force scan (default, best for small catalogs)
+#   ivf    inverted file over k-means cells, tune recall with nprobe
+#   hnsw   graph index, tune recall with efSearch (no removals, deltas rebuild from the store)
+#   ivfpq  inverted file with product-quantized vectors, smallest memory footprint
+#
+# Every kind takes external ids (the content hashes from the embedding store).
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# k-means wants ~39 training points per centroid, PQ codebooks have 256 centroids
+MIN_POINTS_PER_CELL = 39
+PQ_CENTROIDS = 256
+
+
+def auto_nlist(n: int) -> int:
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CELL))
+
+
+def auto_pq_m(dim: int) -> int:
+    # 8 dimensions per sub-quantizer, m has to divide dim
+    m = max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def resolve_kind(kind: str, n: int) -> str:
+    """Falls back to a simpler index when the catalog is too small to train the requested one."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown INDEX_TYPE '{kind}', expected one of {', '.join(INDEX_TYPES)}")
+    if kind == "ivfpq" and n < PQ_CENTROIDS:
+        kind = "ivf"
+    if kind == "ivf" and n < MIN_POINTS_PER_CELL * 2:
+        kind = "flat"
+    return kind
+
+
+def make_index(kind: str, dim: int, n: int, nlist: int = 0, hnsw_m: int = 32, pq_m: int = 0):
+    if kind == "flat":
+        return faiss.index_factory(dim, "IDMap2,Flat")
+    if kind == "hnsw":
+        return faiss.index_factory(dim, f"IDMap2,HNSW{hnsw_m}")
+    nlist = min(nlist or auto_nlist(n), max(1, n))
+    if kind == "ivf":
+        return faiss.index_factory(dim, f"IVF{nlist},Flat")
+    return faiss.index_factory(dim, f"IVF{nlist},PQ{pq_m or auto_pq_m(dim)}")
+
+
+def build(kind: str, vectors, ids, nlist: int = 0, hnsw_m: int = 32, pq_m: int = 0):
+    """Creates, trains and fills an index of the requested kind."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    new_index = make_index(kind, vectors.shape[1], len(vectors), nlist, hnsw_m, pq_m)
+    if not new_index.is_trained:
+        new_index.train(vectors)
+    new_index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return new_index
+
+
+def unwrap(index):
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index):
+    """Kind of a built index, or None for the legacy position-addressed IndexFlatL2."""
+    inner = unwrap(index)
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIDMap2):
+        return "flat"
+    return None
+
+
+def supports_remove(index) -> bool:
+    return index_kind(index) != "hnsw"
+
+
+def set_defaults(index, nprobe: int = 0, ef_search: int = 0):
+    """Applies the default search-time knobs that the index was configured with."""
+    inner = unwrap(index)
+    if nprobe and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(int(nprobe), inner.nlist)
+    if ef_search and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = int(ef_search)
+
+
+def search_params(index, nprobe=None, ef_search=None, exclude=None):
+    """
+    Per-query overrides, passed to index.search(..., params=) so the shared index is never mutated.
+    `exclude` is a faiss.IDSelector for ids to leave out of the results.
+    """
+    inner = unwrap(index)
+    params = None
+    # Passing params replaces the index's own nprobe/efSearch, so carry those over
+    if isinstance(inner, faiss.IndexIVF) and (nprobe or exclude is not None):
+        params = faiss.SearchParametersIVF(nprobe=min(int(nprobe or inner.nprobe), inner.nlist))
+    elif isinstance(inner, faiss.IndexHNSW) and (ef_search or exclude is not None):
+        params = faiss.SearchParametersHNSW(efSearch=int(ef_search or inner.hnsw.efSearch))
+    elif exclude is not None:
+        params = faiss.SearchParameters()
+    if params is not None and exclude is not None:
+        params.sel = exclude
+    return params
+
+
+def describe(index) -> dict:
+    inner = unwrap(index)
+    info = {"type": index_kind(index) or "legacy", "ntotal": int(index.ntotal)}
+    if isinstance(inner, faiss.IndexIVF):
+        info.update(nlist=int(inner.nlist), nprobe=int(inner.nprobe))
+    if isinstance(inner, faiss.IndexHNSW):
+        info.update(efSearch=int(inner.hnsw.efSearch))
+    return info
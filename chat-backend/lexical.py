@@ -0,0 +1,141 @@
+import os
+import re
+import json
+from collections import Counter
+import numpy as np
+
+# Fields of a catalog row that go into the BM25 text
+LEXICAL_FIELDS = ["title", "authors", "genres"]
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text) -> list:
+    return TOKEN_RE.findall(str(text).lower()) if text is not None else []
+
+
+def book_text(book) -> str:
+    return " ".join(str(book.get(field)) for field in LEXICAL_FIELDS if book.get(field) is not None)
+
+
+def rrf(rankings, limit, k=60):
+    """
+    Reciprocal rank fusion: every id scores sum(1 / (k + rank)) over the
+    rankings it appears in. Returns the best `limit` ids, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            if i != -1:
+                scores[i] = scores.get(i, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the rows of a Catalog, as an inverted index in CSR form.
+
+    Postings for term t are rows[indptr[t]:indptr[t + 1]] with their BM25
+    weights precomputed, so a query is one bincount over the postings of its
+    terms. All arrays can be saved with a snapshot and memory-mapped.
+    """
+
+    def __init__(self, vocab, indptr, rows, weights, n_docs, avgdl, k1=1.2, b=0.75):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+        self.n_docs = n_docs
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts, k1=1.2, b=0.75):
+        vocab, rows, terms, freqs, lengths = {}, [], [], [], []
+        for pos, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                terms.append(vocab.setdefault(term, len(vocab)))
+                rows.append(pos)
+                freqs.append(tf)
+        n_docs = len(lengths)
+        lengths = np.asarray(lengths, dtype="float32")
+        avgdl = float(lengths.mean()) if n_docs and lengths.sum() else 1.0
+
+        terms = np.asarray(terms, dtype="int64")
+        order = np.argsort(terms, kind="stable")
+        rows = np.asarray(rows, dtype="int32")[order]
+        freqs = np.asarray(freqs, dtype="float32")[order]
+        indptr = np.zeros(len(vocab) + 1, dtype="int64")
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=indptr[1:])
+
+        index = cls(vocab, indptr, rows, None, n_docs, avgdl, k1, b)
+        idf = np.repeat(index.idf(np.diff(indptr)), np.diff(indptr))
+        index.weights = (idf * index.saturate(freqs, lengths[rows])).astype("float32")
+        return index
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        columns = [catalog.columns[field] for field in LEXICAL_FIELDS if field in catalog.columns]
+        texts = (" ".join(str(v) for v in values if v is not None) for values in zip(*columns))
+        return cls.build(texts)
+
+    def idf(self, df):
+        return np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+
+    def saturate(self, tf, length):
+        return tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / self.avgdl))
+
+    def _terms(self, query):
+        return [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+
+    def search(self, query, k):
+        """(scores, row positions) of the k best rows, best first. Rows sharing no term with the query are left out."""
+        terms = self._terms(query)
+        if not terms or not self.n_docs:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        rows = np.concatenate([self.rows[self.indptr[t]:self.indptr[t + 1]] for t in terms])
+        weights = np.concatenate([self.weights[self.indptr[t]:self.indptr[t + 1]] for t in terms])
+        scores = np.bincount(rows, weights, minlength=self.n_docs)
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return scores[hits].astype("float32"), hits.astype("int64")
+
+    def score(self, query, texts):
+        """BM25 scores of texts outside the index (e.g. live changes), with this index's statistics."""
+        query = list(dict.fromkeys(tokenize(query)))
+        df = np.asarray([self.indptr[self.vocab[t] + 1] - self.indptr[self.vocab[t]] if t in self.vocab else 0 for t in query])
+        idf = self.idf(df)
+        scores = np.zeros(len(texts), dtype="float32")
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            tf = np.asarray([counts.get(t, 0) for t in query], dtype="float32")
+            scores[i] = float((idf * self.saturate(tf, sum(counts.values()))).sum())
+        return scores
+
+    def save(self, path):
+        np.save(os.path.join(path, "bm25.indptr.npy"), self.indptr)
+        np.save(os.path.join(path, "bm25.rows.npy"), self.rows)
+        np.save(os.path.join(path, "bm25.weights.npy"), self.weights)
+        with open(os.path.join(path, "bm25.json"), "w") as f:
+            # Terms in id order
+            json.dump({"n_docs": self.n_docs, "avgdl": self.avgdl, "k1": self.k1, "b": self.b, "terms": list(self.vocab)}, f)
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Returns None for snapshots written without a BM25 index."""
+        if not os.path.exists(os.path.join(path, "bm25.json")):
+            return None
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "bm25.json")) as f:
+            meta = json.load(f)
+        return cls(
+            {term: i for i, term in enumerate(meta["terms"])},
+            np.load(os.path.join(path, "bm25.indptr.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "bm25.rows.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, "bm25.weights.npy"), mmap_mode=mode),
+            meta["n_docs"], meta["avgdl"], meta["k1"], meta["b"],
+        )
@@ -0,0 +1,389 @@
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from collections import Counter, OrderedDict
+import faiss
+import numpy as np
+import pandas as pd
+from catalog import Catalog, FIELDS
+from embedding_store import content_id
+from lexical import book_text
+from autocomplete import PrefixIndex, complete
+from per_process import PerProcess
+
+try:
+    from bson import Timestamp
+    from pymongo import MongoClient
+    from pymongo.errors import OperationFailure
+except ImportError:  # live sync is optional
+    MongoClient = None
+
+# Server errors meaning "no change stream here" and "start time no longer in the oplog"
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40415, 136)
+CHANGE_STREAM_HISTORY_LOST = 286
+# Longest wait between retries while the feed keeps failing
+MAX_BACKOFF_SECONDS = 60
+
+# Keeps search fresh between rebuilds by tailing the books collection.
+#
+# Changes are not written into the snapshot, which is read-only and shared
+# between processes. They are kept as an overlay on top of it: a small flat
+# index for books whose text is new, replacement records for books whose
+# stock, price etc. changed, and tombstones for FAISS ids that no book uses
+# any more. Once the overlay holds SYNC_COMPACT_AFTER changes a rebuild folds
+# it into a new snapshot and the overlay starts again from there.
+
+
+def doc_vector_id(doc) -> int:
+    # Same text as build_index embeds
+    return content_id(f"{doc.get('title')} by {doc.get('authors')}")
+
+
+def book_record(doc) -> dict:
+    # Values as db-backend /books would send them (ObjectIds and dates as strings)
+    return json.loads(json.dumps({field: doc.get(field) for field in FIELDS}, default=str))
+
+
+class OverlayCatalog:
+    """
+    A Catalog with some books replaced, added or removed. Its "positions"
+    are FAISS ids, so find() and gather() work like Catalog's for the router.
+    """
+
+    def __init__(self, base, changes, hidden, version):
+        self.base = base
+        self.changes = changes
+        # Base ids that are removed or have a replacement record in `changes`
+        self.hidden = hidden
+        self.version = version
+        self._len = len(base) - int(np.isin(hidden, base.ids).sum()) + len(changes)
+
+    def __len__(self):
+        return self._len
+
+    def lookup(self, vector_ids, fields=FIELDS):
+        vector_ids = np.asarray(vector_ids, dtype="int64")
+        found = {}
+        pos = self.changes.positions(vector_ids)
+        found.update(zip(self.changes.ids[pos].tolist(), self.changes.gather(pos, fields)))
+        visible = vector_ids[~np.isin(vector_ids, self.hidden)]
+        pos = self.base.positions(visible)
+        found.update(zip(np.asarray(self.base.ids[pos]).tolist(), self.base.gather(pos, fields)))
+        return [found[i] for i in vector_ids.tolist() if i in found]
+
+    def gather(self, vector_ids, fields=FIELDS):
+        return self.lookup(vector_ids, fields)
+
+    def find(self, field, key, normalize):
+        ids = np.asarray(self.base.ids[self.base.find(field, key, normalize)], dtype="int64")
+        ids = ids[~np.isin(ids, self.hidden)].tolist()
+        return ids + self.changes.ids[self.changes.find(field, key, normalize)].tolist()
+
+
+class LiveSnapshot:
+    """A Snapshot plus the changes received since it was built. Never modified once published."""
+
+    def __init__(self, base, delta, catalog, tombstones, changes):
+        self.base = base
+        self.index = base.index
+        self.delta = delta
+        self.catalog = catalog
+        self.version = catalog.version
+        self.name = base.name
+        self.built_at = base.built_at
+        self.as_of = base.as_of
+        self.docs = base.docs
+        self.changes = changes
+        # Kept alive here, FAISS only holds a pointer to it
+        self._tombstones = tombstones
+        self._exclude = faiss.IDSelectorNot(faiss.IDSelectorBatch(tombstones)) if len(tombstones) else None
+        self._prefix = PrefixIndex.from_catalog(catalog.changes)
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        D, I = self.base.search(queries, k, nprobe, ef_search, exclude=self._exclude)
+        if not self.delta.ntotal:
+            return D, I
+        dD, dI = self.delta.search(queries, k)
+        D, I = np.hstack([D, dD]), np.hstack([I, dI])
+        # Missing results have the largest distance, so they sort last
+        order = np.argsort(D, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(D, order, 1), np.take_along_axis(I, order, 1)
+
+    def lexical_search(self, query, k):
+        hidden = self.catalog.hidden
+        scores, ids = self.base.lexical_search(query, k + len(hidden))
+        keep = ~np.isin(ids, hidden)
+        scores, ids = scores[keep], ids[keep]
+        changes = self.catalog.changes
+        if len(changes):
+            # Changed books are scored with the base index's statistics, so the scores compare
+            books = changes.gather(np.arange(len(changes)))
+            extra = self.base.lexical.score(query, [book_text(book) for book in books])
+            matched = extra > 0
+            scores = np.concatenate([scores, extra[matched]])
+            ids = np.concatenate([ids, np.asarray(changes.ids, dtype="int64")[matched]])
+        order = np.argsort(-scores, kind="stable")[:k]
+        return scores[order], ids[order]
+
+    def autocomplete(self, prefix, k):
+        return complete([
+            (self.base.catalog, self.base.prefix, self.catalog.hidden),
+            (self.catalog.changes, self._prefix, None),
+        ], prefix, k)
+
+    def describe(self) -> dict:
+        return {
+            **self.base.describe(),
+            "version": self.version,
+            "books": len(self.catalog),
+            "live_changes": self.changes,
+            "live_vectors": self.delta.ntotal,
+            "tombstones": len(self._tombstones),
+        }
+
+
+class LiveSync:
+    """
+    Tails the books collection and publishes a LiveSnapshot after every batch
+    of changes. Uses a change stream when the server supports one (replica
+    sets), otherwise polls `updated_at` and compares _ids every
+    `reconcile_every` seconds to notice deletes.
+    """
+
+    def __init__(self, uri, db_name, collection, publish, encode, compact,
+                 mode="auto", batch_size=200, batch_wait=0.5, poll_interval=2.0,
+                 reconcile_every=300.0, compact_after=1000):
+        if MongoClient is None:
+            raise RuntimeError("Live sync needs pymongo (pip install pymongo)")
+        self.uri = uri
+        self.db_name = db_name
+        self.collection_name = collection
+        self.publish = publish
+        self.encode = encode
+        self.compact = compact
+        self.mode = mode
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.poll_interval = poll_interval
+        self.reconcile_every = reconcile_every
+        self.compact_after = compact_after
+        self.base = None
+        # doc _id -> (time received, document or None if deleted), oldest first
+        self.pending = OrderedDict()
+        self._vectors = {}
+        self._lock = threading.Lock()
+        self._thread = PerProcess(self._spawn)
+        self.active_mode = None
+        self.batches = 0
+        self.changes = 0
+        self.compactions = 0
+        self.last_change = None
+        self.last_sync = None
+        self.last_error = None
+        self.errors = 0
+        self._failures = 0
+
+    # -- overlay --
+
+    def rebase(self, base):
+        """Called with every newly published snapshot; keeps the changes it does not contain yet."""
+        with self._lock:
+            self.base = base
+            for doc_id, (received, _) in list(self.pending.items()):
+                if received < base.as_of:
+                    del self.pending[doc_id]
+            self._publish()
+
+    def apply(self, changes):
+        """changes: [(doc_id, document or None)] in the order they happened."""
+        received = time.time()
+        with self._lock:
+            for doc_id, doc in changes:
+                self.pending.pop(doc_id, None)
+                self.pending[doc_id] = (received, doc)
+            self.batches += 1
+            self.changes += len(changes)
+            self.last_change = received
+            if self.base is not None:
+                self._publish()
+            too_many = len(self.pending) >= self.compact_after or (self.base is not None and self.base.docs is None)
+        if too_many:
+            # Fold the overlay into a new snapshot, which rebase() then drops from pending
+            self.compactions += 1
+            self.compact()
+
+    def _publish(self):
+        self.publish(self._materialize() if self.pending else self.base)
+
+    def _materialize(self):
+        base, docs = self.base, self.base.docs
+        leaving, arriving, latest = Counter(), Counter(), {}
+        for doc_id, (_, doc) in self.pending.items():
+            old = docs.get(doc_id) if docs is not None else None
+            if old is not None:
+                leaving[old] += 1
+            if doc is not None:
+                vector_id = doc_vector_id(doc)
+                arriving[vector_id] += 1
+                latest.pop(vector_id, None)
+                latest[vector_id] = (doc, book_record(doc))
+
+        in_base = lambda ids: np.isin(np.asarray(ids, dtype="int64"), base.catalog.ids)  # noqa: E731
+        left = [i for i, n in leaving.items() if docs.count(i) - n + arriving[i] <= 0]
+        tombstones = np.asarray(sorted(left), dtype="int64")
+
+        ids = np.asarray(list(latest), dtype="int64")
+        new_ids = ids[~in_base(ids)] if len(ids) else ids
+        # Vectors depend only on the text, so a book only needs encoding once
+        missing = [i for i in new_ids.tolist() if i not in self._vectors]
+        if missing:
+            texts = [f"{latest[i][0].get('title')} by {latest[i][0].get('authors')}" for i in missing]
+            self._vectors.update(zip(missing, self.encode(texts)))
+        delta = faiss.IndexIDMap2(faiss.IndexFlatL2(base.index.d))
+        if len(new_ids):
+            delta.add_with_ids(np.vstack([self._vectors[i] for i in new_ids.tolist()]).astype("float32"), new_ids)
+        self._vectors = {i: self._vectors[i] for i in new_ids.tolist()}
+
+        # object columns, so a changed stock count stays an int and a missing field None
+        frame = pd.DataFrame([record for _, record in latest.values()], columns=FIELDS, dtype=object)
+        frame["vector_id"] = ids
+        changes = Catalog.from_dataframe(frame)
+        hidden = np.union1d(tombstones, ids[in_base(ids)] if len(ids) else ids)
+        catalog = OverlayCatalog(base.catalog, changes, hidden, f"{base.version}+{self._fingerprint()}")
+        return LiveSnapshot(base, delta, catalog, tombstones, len(self.pending))
+
+    def _fingerprint(self):
+        # From the pending changes themselves, so workers and replicas holding the same
+        # overlay agree on the version and ones holding different overlays never do
+        changes = sorted((doc_id, book_record(doc) if doc is not None else None) for doc_id, (_, doc) in self.pending.items())
+        return hashlib.blake2b(json.dumps(changes, default=str).encode("utf-8"), digest_size=8).hexdigest()
+
+    # -- change feed --
+
+    def start(self):
+        self._thread.get()
+
+    def _spawn(self):
+        thread = threading.Thread(target=self._run, name="live-sync", daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        collection = None
+        while True:
+            try:
+                if collection is None:
+                    collection = MongoClient(self.uri)[self.db_name][self.collection_name]
+                if self.mode in ("auto", "changestream"):
+                    try:
+                        self._watch(collection)
+                    except OperationFailure as e:
+                        if self.mode == "changestream" or e.code not in CHANGE_STREAMS_UNSUPPORTED:
+                            raise
+                        print(f"Change streams unavailable ({e}), polling updated_at instead", flush=True)
+                        self.mode = "poll"
+                        continue
+                self._poll(collection)
+            except Exception as e:
+                # Whatever fails, keep the thread alive; stats() shows the error and how stale the overlay is
+                self.errors += 1
+                self._failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Live sync error: {self.last_error}", flush=True)
+                time.sleep(min(self.poll_interval * 2 ** (self._failures - 1), MAX_BACKOFF_SECONDS))
+
+    def _synced(self):
+        """Called after every successful read from the collection."""
+        self.last_sync = time.time()
+        self._failures = 0
+
+    def _since(self):
+        # Start from the snapshot's fetch time, overlapping a little for clock skew
+        base = self.base
+        return (base.as_of if base is not None else time.time()) - 5
+
+    def _watch(self, collection):
+        options = {"full_document": "updateLookup", "max_await_time_ms": int(self.batch_wait * 1000)}
+        options["start_at_operation_time"] = Timestamp(int(self._since()), 0)
+        while True:
+            try:
+                stream = collection.watch(**options)
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_HISTORY_LOST or "start_at_operation_time" not in options:
+                    raise
+                # The oplog no longer reaches back to the snapshot, rebuild instead
+                self.compact()
+                del options["start_at_operation_time"]
+                continue
+            self.active_mode = "changestream"
+            with stream:
+                batch, deadline = [], None
+                while stream.alive:
+                    event = stream.try_next()
+                    self._synced()
+                    if event is not None:
+                        options.pop("start_at_operation_time", None)
+                        options["resume_after"] = stream.resume_token
+                        operation = event["operationType"]
+                        if operation in ("insert", "update", "replace", "delete"):
+                            doc = event.get("fullDocument") if operation != "delete" else None
+                            batch.append((str(event["documentKey"]["_id"]), doc))
+                            deadline = deadline or time.monotonic() + self.batch_wait
+                        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+                            self.compact()
+                            options.pop("resume_after", None)
+                            break
+                    if batch and (len(batch) >= self.batch_size or event is None or time.monotonic() >= deadline):
+                        self.apply(batch)
+                        batch, deadline = [], None
+
+    def _poll(self, collection):
+        self.active_mode = "poll"
+        # Keyset on (updated_at, _id): one CSV chunk shares a single updated_at
+        query = {"updated_at": {"$gte": datetime.fromtimestamp(self._since(), timezone.utc)}}
+        next_reconcile = time.monotonic() + self.reconcile_every
+        while True:
+            docs = list(collection.find(query).sort([("updated_at", 1), ("_id", 1)]).limit(self.batch_size))
+            self._synced()
+            if docs:
+                self.apply([(str(doc["_id"]), doc) for doc in docs])
+                last = docs[-1]
+                query = {"$or": [
+                    {"updated_at": {"$gt": last["updated_at"]}},
+                    {"updated_at": last["updated_at"], "_id": {"$gt": last["_id"]}},
+                ]}
+                if len(docs) == self.batch_size:
+                    continue
+            if time.monotonic() >= next_reconcile:
+                self._reconcile(collection)
+                next_reconcile = time.monotonic() + self.reconcile_every
+            time.sleep(self.poll_interval)
+
+    def _reconcile(self, collection):
+        # Polling cannot see deletes, so compare the _ids we know with the ones still there
+        base = self.base
+        if base is None or base.docs is None:
+            return
+        present = {str(doc["_id"]) for doc in collection.find({}, {"_id": 1})}
+        with self._lock:
+            known = set(base.docs.doc_ids.tolist())
+            for doc_id, (_, doc) in self.pending.items():
+                (known.add if doc is not None else known.discard)(doc_id)
+        gone = known - present
+        if gone:
+            self.apply([(doc_id, None) for doc_id in sorted(gone)])
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.active_mode,
+            "pending": len(self.pending),
+            "batches": self.batches,
+            "changes": self.changes,
+            "compactions": self.compactions,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "seconds_since_change": round(time.time() - self.last_change, 1) if self.last_change else None,
+            "seconds_since_sync": round(time.time() - self.last_sync, 1) if self.last_sync else None,
+        }
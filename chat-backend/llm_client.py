@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import LLM_ROUNDS, debug_log, span
+from per_process import PerProcess
+
+# Clients for Ollama's /api/chat and the book_search/reply tool loop.
+#
+# LLMClient keeps a pooled keep-alive requests.Session for request threads.
+# AsyncLLMClient does the same over httpx for asyncio code; LLMEventLoop runs
+# those coroutines on one background loop so many chats can wait on Ollama at
+# once. Both drive the same tool loop (chat_steps), so their behaviour matches.
+#
+# Only the calls to Ollama are asynchronous. gunicorn's gthread workers give
+# every HTTP request its own thread, and /chat's thread still waits on
+# LLMEventLoop.run() until the whole tool loop is done, so size
+# WORKER_THREADS for the chats in flight.
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class LLMClient:
+    def __init__(self, endpoint, model, connect_timeout=5.0, read_timeout=120.0, retries=2, pool_size=16):
+        self.endpoint = endpoint
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Retry refused connections and gateway errors, never a generation that timed out
+        retry = Retry(
+            total=retries, connect=retries, read=0, status=retries,
+            backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+            allowed_methods=None, raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def payload(self, messages, tools, stream):
+        return {"model": self.model, "messages": messages, "tools": tools, "stream": stream}
+
+    def chat(self, messages, tools) -> dict:
+        response = self.session.post(self.endpoint, json=self.payload(messages, tools, False), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, messages, tools):
+        """Returns the open streaming response, use it as a context manager."""
+        response = self.session.post(
+            self.endpoint, json=self.payload(messages, tools, True), timeout=self.timeout, stream=True
+        )
+        response.raise_for_status()
+        return response
+
+
+class AsyncLLMClient:
+    def __init__(self, endpoint, model, connect_timeout=5.0, read_timeout=120.0, retries=2, pool_size=16):
+        self.endpoint = endpoint
+        self.model = model
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            # Transport retries cover connection failures only
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+        )
+
+    async def chat(self, messages, tools) -> dict:
+        payload = {"model": self.model, "messages": messages, "tools": tools, "stream": False}
+        for attempt in range(self.retries + 1):
+            response = await self.client.post(self.endpoint, json=payload)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            await asyncio.sleep(0.5 * 2 ** attempt)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class LLMEventLoop:
+    """
+    A background asyncio loop shared by all request threads of this process,
+    with the client that runs on it.
+    """
+
+    def __init__(self, client_factory):
+        self.client_factory = client_factory
+        self._started = PerProcess(self._start)
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return loop, asyncio.run_coroutine_threadsafe(self._make_client(), loop).result()
+
+    async def _make_client(self):
+        return self.client_factory()
+
+    def run(self, coro_fn, *args, timeout=None):
+        """Runs coro_fn(client, *args) on the loop and waits for its result."""
+        loop, client = self._started.get()
+        future = asyncio.run_coroutine_threadsafe(coro_fn(client, *args), loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+
+def clean_reply(reply: str) -> str:
+    if "{" in reply:
+        # Remove hidden reasoning if present
+        reply = reply.split("}", 1)[-1].strip()
+    return reply
+
+
+def chat_steps(messages, tools, max_rounds=3):
+    """
+    The tool loop as a state machine. Yields what it needs next, either
+    ("llm", tools) or ("tool", name, arguments), and is sent back the
+    assistant message (None if the LLM failed) or the tool message. Returns
+    once `messages` ends with the reply for the user.
+    """
+    reply_tools = [tool for tool in tools if tool["function"]["name"] == "reply"]
+    for _ in range(max_rounds):
+        assistant_msg = yield ("llm", tools)
+        if assistant_msg is None:
+            return
+        messages.append(assistant_msg)
+
+        # --- No tool calls; standard assistant reply ---
+        if "tool_calls" not in assistant_msg:
+            reply = clean_reply(assistant_msg.get("content", ""))
+            messages.append({"role": "assistant", "content": reply})
+            debug_log("Final reply:", reply)
+            return
+
+        for call in assistant_msg["tool_calls"]:
+            func_name = call["function"]["name"]
+            args = call["function"].get("arguments", {})
+
+            # --- Book search tool, then ask again with only the reply tool ---
+            if func_name == "book_search" and args.get("query"):
+                messages.append((yield ("tool", func_name, args)))
+                tools = reply_tools
+                break
+
+            # --- Reply tool ---
+            if func_name == "reply":
+                reply_text = args.get("reply", "")
+                messages.append({"role": "assistant", "content": reply_text})
+                debug_log("Reply added:", reply_text)
+                return
+        else:
+            return
+
+
+def run_chat(client, messages, tools, run_tool):
+    steps = chat_steps(messages, tools)
+    result = None
+    try:
+        while True:
+            step = steps.send(result)
+            if step[0] == "llm":
+                try:
+                    with span("llm"):
+                        data = client.chat(messages, step[1])
+                except Exception as e:
+                    LLM_ROUNDS.labels("error").inc()
+                    print(f"Error contacting LLM: {e}", flush=True)
+                    result = None
+                else:
+                    LLM_ROUNDS.labels("ok").inc()
+                    debug_log("LLM response:", data)
+                    result = data.get("message", {})
+            else:
+                result = run_tool(step[1], step[2])
+    except StopIteration:
+        return messages
+
+
+async def run_chat_async(client, messages, tools, run_tool):
+    loop = asyncio.get_running_loop()
+    steps = chat_steps(messages, tools)
+    result = None
+    try:
+        while True:
+            step = steps.send(result)
+            if step[0] == "llm":
+                try:
+                    with span("llm"):
+                        data = await client.chat(messages, step[1])
+                except Exception as e:
+                    LLM_ROUNDS.labels("error").inc()
+                    print(f"Error contacting LLM: {e}", flush=True)
+                    result = None
+                else:
+                    LLM_ROUNDS.labels("ok").inc()
+                    debug_log("LLM response:", data)
+                    result = data.get("message", {})
+            else:
+                # Tools are CPU-bound (encode + FAISS), keep them off the event loop
+                result = await loop.run_in_executor(None, run_tool, step[1], step[2])
+    except StopIteration:
+        return messages
@@ -0,0 +1,90 @@
+import os
+import json
+import queue
+import random
+import threading
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+from per_process import PerProcess
+
+# Prometheus metrics for GET /metrics.
+#
+# chat_stage_seconds times each step of a search or chat (embedding the
+# query, the FAISS and BM25 searches, turning ids into books, every LLM
+# round and the book_search tool), so a slow request can be pinned on one of
+# them. Under gunicorn every worker writes its samples to
+# PROMETHEUS_MULTIPROC_DIR (set up in gunicorn.conf.py) and /metrics adds the
+# workers up.
+
+# Fraction of hot-path debug lines that are printed, 1 prints all of them, 0 none
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv('DEBUG_LOG_SAMPLE_RATE', '0.01'))
+DEBUG_LOG_QUEUE = int(os.getenv('DEBUG_LOG_QUEUE', '1000'))
+
+# Sub-millisecond steps (cached embeddings, BM25 on a small catalog) up to LLM rounds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram("chat_stage_seconds", "Time spent in each stage of a search or chat", ["stage"], buckets=BUCKETS)
+HTTP_SECONDS = Histogram(
+    "chat_http_request_seconds", "Time to the response headers, by route", ["method", "route", "status"], buckets=BUCKETS
+)
+LLM_ROUNDS = Counter("chat_llm_rounds_total", "LLM calls by outcome", ["outcome"])
+DEBUG_LOG_DROPPED = Counter("chat_debug_log_dropped_total", "Sampled debug lines dropped because the log queue was full")
+
+
+def span(stage):
+    """Times the with-block into chat_stage_seconds{stage=...}."""
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def render():
+    """Body and content type for /metrics."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class SampledLog:
+    """
+    Debug output from request paths. Only a `rate` fraction of calls is kept,
+    and those are formatted and printed by a background thread, so a request
+    never waits on json.dumps or stdout. Arguments that are not strings are
+    printed as JSON; callables are called first, on the log thread. Lines
+    that find the queue full are dropped and counted.
+    """
+
+    def __init__(self, rate, maxsize=1000):
+        self.rate = rate
+        self.maxsize = maxsize
+        self._queue = PerProcess(self._start)
+
+    def __call__(self, *args):
+        if self.rate <= 0 or (self.rate < 1 and random.random() >= self.rate):
+            return
+        try:
+            self._queue.get().put_nowait(args)
+        except queue.Full:
+            DEBUG_LOG_DROPPED.inc()
+
+    def _start(self):
+        lines = queue.Queue(self.maxsize)
+        threading.Thread(target=self._drain, args=(lines,), name="debug-log", daemon=True).start()
+        return lines
+
+    @staticmethod
+    def _format(arg):
+        arg = arg() if callable(arg) else arg
+        return arg if isinstance(arg, str) else json.dumps(arg, indent=2, default=str)
+
+    def _drain(self, lines):
+        while True:
+            args = lines.get()
+            try:
+                print(*(self._format(arg) for arg in args), flush=True)
+            except Exception as e:
+                print(f"Debug log failed: {e}", flush=True)
+
+
+debug_log = SampledLog(DEBUG_LOG_SAMPLE_RATE, DEBUG_LOG_QUEUE)
@@ -0,0 +1,25 @@
+import os
+import threading
+
+
+class PerProcess:
+    """
+    A value made by `factory` on first use in each process. gunicorn forks
+    its workers from a preloaded app and threads do not survive a fork, so
+    anything that owns a background thread (a queue and its consumer, an
+    event loop) is rebuilt by the first caller in every worker.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._value = self.factory()
+                    self._pid = os.getpid()
+        return self._value
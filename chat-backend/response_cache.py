@@ -0,0 +1,81 @@
+import time
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Replies to opening questions, looked up by meaning rather than exact text.
+
+    Question embeddings are unit length, so an inner-product index gives the
+    cosine similarity directly; a hit needs at least `threshold`. Entries are
+    evicted least-recently-used beyond `maxsize` and expire after `ttl`
+    seconds. clear() drops everything, e.g. when the catalog changes.
+    """
+
+    def __init__(self, dim, threshold=0.95, maxsize=1000, ttl=3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._entries = OrderedDict()  # id -> (expires, value)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remove(self, ids):
+        for entry_id in ids:
+            del self._entries[entry_id]
+        self._index.remove_ids(np.asarray(ids, dtype="int64"))
+
+    def get(self, vector):
+        with self._lock:
+            if self._entries:
+                D, I = self._index.search(np.asarray(vector, dtype="float32").reshape(1, -1), 1)
+                entry_id = int(I[0][0])
+                if entry_id >= 0 and D[0][0] >= self.threshold:
+                    expires, value = self._entries[entry_id]
+                    if not expires or expires > time.monotonic():
+                        self._entries.move_to_end(entry_id)
+                        self.hits += 1
+                        return value
+                    self._remove([entry_id])
+            self.misses += 1
+            return None
+
+    def put(self, vector, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(
+                np.asarray(vector, dtype="float32").reshape(1, -1), np.array([entry_id], dtype="int64")
+            )
+            self._entries[entry_id] = (time.monotonic() + self.ttl if self.ttl else 0, value)
+            if len(self._entries) > self.maxsize:
+                self._remove(list(self._entries)[: len(self._entries) - self.maxsize])
+
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._index.reset()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
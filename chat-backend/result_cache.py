@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import threading
+from cache import LRUCache
+
+try:
+    import redis
+except ImportError:  # the shared backend is optional
+    redis = None
+
+# Finished faiss_search results, keyed by normalized query, k, search knobs
+# and the catalog version of the snapshot that answered. A rebuild or a
+# live-sync batch publishes a new version, so results of the old one are
+# simply never asked for again and age out of the LRU (or Redis TTL).
+# Live-sync versions fingerprint the overlay's contents, so processes only
+# share entries when their overlays hold the same changes.
+#
+# With a Redis URL every worker process and replica shares the entries; the
+# local LRU stays in front of it, so repeated queries skip the network too.
+
+
+class ResultCache:
+    def __init__(self, maxsize=2048, ttl=600, redis_url="", prefix="search"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._local = LRUCache(maxsize, ttl)
+        self._redis_url = redis_url
+        self._redis = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.shared_hits = 0
+        self.shared_errors = 0
+        # Time the cached searches took when they ran, added up on every hit
+        self.saved_ms = 0.0
+        if redis_url and redis is None:
+            print("RESULT_CACHE_REDIS_URL is set but redis is not installed, caching per process only", flush=True)
+
+    def key(self, version, query, *params) -> str:
+        digest = hashlib.blake2b(json.dumps([query, *params]).encode("utf-8"), digest_size=12).hexdigest()
+        return f"{self.prefix}:{version}:{digest}"
+
+    @property
+    def _shared(self):
+        # Connections must not cross a fork, so every worker process opens its own
+        if not self._redis_url or redis is None:
+            return None
+        if self._pid != os.getpid():
+            self._redis = redis.Redis.from_url(self._redis_url, socket_timeout=0.05, socket_connect_timeout=0.2)
+            self._pid = os.getpid()
+        return self._redis
+
+    def get(self, key):
+        entry = self._local.get(key)
+        if entry is None and self._shared is not None:
+            try:
+                raw = self._shared.get(key)
+            except redis.RedisError:
+                raw = None
+                self.shared_errors += 1
+            if raw is not None:
+                entry = json.loads(raw)
+                self._local.put(key, entry)
+                with self._lock:
+                    self.shared_hits += 1
+        if entry is None:
+            return None
+        with self._lock:
+            self.saved_ms += entry["ms"]
+        return entry["results"]
+
+    def put(self, key, results, elapsed_ms):
+        entry = {"results": results, "ms": elapsed_ms}
+        self._local.put(key, entry)
+        if self._shared is not None:
+            try:
+                self._shared.set(key, json.dumps(entry, default=str), ex=int(self.ttl) or None)
+            except redis.RedisError:
+                self.shared_errors += 1
+
+    def clear(self):
+        self._local.clear()
+
+    def stats(self) -> dict:
+        local = self._local.stats()
+        # A miss in the local LRU that Redis answered is still a hit
+        hits = local["hits"] + self.shared_hits
+        lookups = local["hits"] + local["misses"]
+        return {
+            **local,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "shared": bool(self._redis_url and redis is not None),
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "saved_ms": round(self.saved_ms, 1),
+            "saved_ms_per_hit": round(self.saved_ms / hits, 2) if hits else 0.0,
+        }
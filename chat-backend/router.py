@@ -0,0 +1,124 @@
+import re
+import threading
+from collections import Counter
+import requests
+from catalog import normalize_isbn, normalize_title
+
+# Fast path in front of the LLM. Exact ISBN and title matches, confident FAQ
+# matches and near-identical FAISS hits are answered directly, everything
+# else falls through to call_llm.
+
+ISBN_RE = re.compile(r"\b(?:97[89][-\s]?)?(?:\d[-\s]?){9}[\dXx]\b")
+QUESTION_PREFIXES = ("do you have", "do you sell", "do you carry", "is there", "looking for", "find me", "find")
+# Without a question prefix a message only counts as a title when it is this long,
+# so "hello" or "thank you" never match a book that happens to be called that
+TITLE_MIN_WORDS = 3
+TITLE_MIN_CHARS = 15
+
+
+def describe_book(book: dict) -> str:
+    try:
+        in_stock = int(float(book.get("stock_count") or 0))
+    except (TypeError, ValueError):
+        in_stock = 0
+    stock = f"{in_stock} in stock" if in_stock > 0 else "currently out of stock"
+    return (
+        f"{book['title']} by {book['authors']} (ISBN: {book['isbn']}) - "
+        f"${book['sale_price']} (regular ${book['std_price']}), {stock}."
+    )
+
+
+class Router:
+    def __init__(self, faq_url="", faq_min_score=90, vector_min_similarity=0.92, faq_timeout=0.5):
+        self.faq_url = faq_url
+        self.faq_min_score = faq_min_score
+        self.vector_min_similarity = vector_min_similarity
+        self.faq_timeout = faq_timeout
+        self.session = requests.Session()
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, route):
+        with self._lock:
+            self.counts[route] += 1
+
+    def route(self, message, catalog, vector_search):
+        """
+        Returns (route, reply) when the message can be answered without the LLM,
+        otherwise None. vector_search(text) gives (cosine similarity, FAISS id)
+        of the best hit.
+        """
+        for route, answer in (
+            ("isbn", lambda: self._isbn(message, catalog)),
+            ("title", lambda: self._title(message, catalog)),
+            ("faq", lambda: self._faq(message)),
+            ("vector", lambda: self._vector(message, catalog, vector_search)),
+        ):
+            reply = answer()
+            if reply:
+                self._count(route)
+                return route, reply
+        self._count("llm")
+        return None
+
+    def _isbn(self, message, catalog):
+        match = ISBN_RE.search(message)
+        if not match:
+            return None
+        books = catalog.gather(catalog.find("isbn", normalize_isbn(match.group()), normalize_isbn))
+        if not books:
+            return None
+        return "Yes, we have " + " ".join(describe_book(b) for b in books)
+
+    def _title(self, message, catalog):
+        text = normalize_title(message)
+        asked = False
+        for prefix in QUESTION_PREFIXES:
+            if text.startswith(prefix + " "):
+                text, asked = text[len(prefix) + 1:], True
+                break
+        if not text:
+            return None
+        if not asked and len(text.split()) < TITLE_MIN_WORDS and len(text) < TITLE_MIN_CHARS:
+            return None
+        books = catalog.gather(catalog.find("title", text, normalize_title))
+        if not books:
+            return None
+        return "Yes, we have " + " ".join(describe_book(b) for b in books)
+
+    def _faq(self, message):
+        if not self.faq_url:
+            return None
+        try:
+            response = self.session.post(self.faq_url, json={"question": message}, timeout=self.faq_timeout)
+            response.raise_for_status()
+            answer = response.json().get("answer")
+        except Exception as e:
+            print(f"FAQ lookup failed: {e}", flush=True)
+            return None
+        if answer and answer.get("confidence", 0) >= self.faq_min_score:
+            return answer["answer"]
+        return None
+
+    def _vector(self, message, catalog, vector_search):
+        if self.vector_min_similarity > 1:
+            return None
+        similarity, vector_id = vector_search(message)
+        if similarity < self.vector_min_similarity:
+            return None
+        books = catalog.lookup([vector_id])
+        if not books:
+            return None
+        return "Here's what I found: " + describe_book(books[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        bypassed = total - counts.get("llm", 0)
+        return {
+            "requests": total,
+            "bypassed_llm": bypassed,
+            "bypass_rate": round(bypassed / total, 4) if total else 0.0,
+            "routes": counts,
+        }
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from cache import LRUCache
+
+# Server-side chat history, so /chat clients only send a session id.
+#
+# The memory backend is a per-process LRU with TTL. The sqlite backend keeps
+# sessions in one file that every worker process can read, which also makes
+# them survive restarts. Histories are compacted to a token budget before
+# each LLM call, so the prompt stays about the same size however long the
+# conversation gets.
+
+
+class SessionStore:
+    def __init__(self, maxsize=10000, ttl=3600, backend="memory", db_path=None):
+        self.ttl = ttl
+        self.backend = backend
+        if backend == "sqlite":
+            self.db_path = db_path
+            self._lock = threading.Lock()
+            self._conn = None
+            self._pid = None
+            self._writes = 0
+        elif backend == "memory":
+            self._cache = LRUCache(maxsize, ttl)
+        else:
+            raise ValueError(f"Unknown SESSION_BACKEND '{backend}', expected memory or sqlite")
+
+    @property
+    def _db(self):
+        # Connections must not cross a fork, so every worker process opens its own
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def get(self, session_id):
+        if self.backend == "memory":
+            return self._cache.get(session_id)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT messages FROM sessions WHERE id = ? AND updated > ?",
+                (session_id, time.time() - self.ttl if self.ttl else 0),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, messages):
+        if self.backend == "memory":
+            self._cache.put(session_id, messages)
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, messages, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(messages), time.time()),
+            )
+            self._writes += 1
+            # Expired sessions are swept every so often instead of on every write
+            if self.ttl and self._writes % 100 == 0:
+                self._db.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+
+    def stats(self) -> dict:
+        if self.backend == "memory":
+            return {"backend": "memory", **self._cache.stats()}
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return {"backend": "sqlite", "size": count, "ttl": self.ttl}
+
+
+def estimate_tokens(message: dict) -> int:
+    # ~4 characters per token is close enough for budgeting
+    size = len(message.get("content") or "")
+    if "tool_calls" in message:
+        size += len(json.dumps(message["tool_calls"]))
+    return size // 4 + 4
+
+
+SUMMARY_PREFIX = "Earlier results: "
+
+
+def summarize_tool_output(message: dict) -> dict:
+    if (message.get("content") or "").startswith(SUMMARY_PREFIX):
+        return message
+    # book_search lines look like "Title by Author (Genres: ..., ISBN: ...)"
+    books = [line.split(" (", 1)[0] for line in (message.get("content") or "").splitlines() if line.strip()]
+    return {**message, "content": SUMMARY_PREFIX + "; ".join(books)}
+
+
+def compact_history(messages, budget=1500, keep_turns=2):
+    """
+    Returns a copy of messages that fits in about `budget` tokens. The system
+    prompt and the last `keep_turns` user turns are kept as they are. Older
+    tool outputs are cut down to their book titles, and if that is not enough
+    the oldest messages are dropped.
+    """
+    system = [m for m in messages[:1] if m.get("role") == "system"]
+    rest = messages[len(system):]
+
+    user_turns = [i for i, m in enumerate(rest) if m.get("role") == "user"]
+    split = user_turns[-keep_turns] if len(user_turns) >= keep_turns else 0
+    older, recent = rest[:split], rest[split:]
+
+    older = [summarize_tool_output(m) if m.get("role") == "tool" else m for m in older]
+    older = [{k: v for k, v in m.items() if k != "tool_calls"} for m in older]
+    older = [m for m in older if m.get("content")]
+
+    used = sum(estimate_tokens(m) for m in system + recent)
+    kept = []
+    for message in reversed(older):
+        used += estimate_tokens(message)
+        if used > budget:
+            break
+        kept.append(message)
+    return system + kept[::-1] + recent
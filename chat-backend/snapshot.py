@@ -0,0 +1,344 @@
+import os
+import json
+import fcntl
+import time
+import uuid
+import queue
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import faiss
+import numpy as np
+import index_factory
+from catalog import Catalog, DocMap
+from lexical import BM25Index
+from autocomplete import PrefixIndex, complete
+from per_process import PerProcess
+
+# On disk every snapshot is a directory INDEX_PATH/snapshots/<name>/ holding
+# index.faiss, the catalog columns as .npy files and manifest.json. The file
+# INDEX_PATH/current names the live one and is replaced atomically, so
+# readers only ever see a complete snapshot.
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "current"
+INDEX_FILE = "index.faiss"
+MANIFEST_FILE = "manifest.json"
+
+
+class Snapshot:
+    """
+    One FAISS index together with the catalog it was built from.
+
+    Searches take a single reference to the live snapshot and use its index
+    and catalog together, so a rebuild swapping in a new snapshot can never
+    pair a new index with old book data. Snapshots are never modified after
+    they are published.
+    """
+
+    def __init__(self, index, catalog, built_at=None, name=None, docs=None, as_of=None, lexical=None, prefix=None):
+        self.index = index
+        self.catalog = catalog
+        self.version = catalog.version
+        self.built_at = built_at or time.time()
+        # Directory under snapshots/ once written to disk
+        self.name = name
+        # Mongo _id -> FAISS id of every book, used by live_sync.py
+        self.docs = docs
+        # When the books were fetched, every change before this is included
+        self.as_of = as_of or self.built_at
+        self._lexical = lexical
+        self._prefix = prefix
+        self._lazy_lock = threading.Lock()
+
+    @property
+    def lexical(self):
+        """BM25 index over the catalog, built on first use for snapshots written without one."""
+        if self._lexical is None:
+            with self._lazy_lock:
+                if self._lexical is None:
+                    self._lexical = BM25Index.from_catalog(self.catalog)
+        return self._lexical
+
+    @property
+    def prefix(self):
+        """Typeahead index over the catalog, built on first use for snapshots written without one."""
+        if self._prefix is None:
+            with self._lazy_lock:
+                if self._prefix is None:
+                    self._prefix = PrefixIndex.from_catalog(self.catalog)
+        return self._prefix
+
+    @property
+    def base(self):
+        """The snapshot on disk that this one serves (itself, see live_sync.LiveSnapshot)."""
+        return self
+
+    def search(self, queries, k, nprobe=None, ef_search=None, exclude=None):
+        params = index_factory.search_params(self.index, nprobe, ef_search, exclude)
+        return self.index.search(queries, k, params=params)
+
+    def lexical_search(self, query, k):
+        """(BM25 scores, FAISS ids) of the k best keyword matches."""
+        scores, positions = self.lexical.search(query, k)
+        return scores, np.asarray(self.catalog.ids[positions], dtype="int64")
+
+    def autocomplete(self, prefix, k):
+        return complete([(self.catalog, self.prefix, None)], prefix, k)
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "books": len(self.catalog),
+            "vectors": self.index.ntotal,
+            "built_at": self.built_at,
+            "as_of": self.as_of,
+        }
+
+
+def snapshot_path(root, name):
+    return os.path.join(root, SNAPSHOTS_DIR, name)
+
+
+def current_name(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot(root, snapshot, keep=3):
+    """
+    Writes snapshot to a new directory, points `current` at it and deletes all
+    but the newest `keep` snapshots. Returns the directory name.
+    """
+    name = f"{int(snapshot.built_at * 1000)}-{snapshot.version}"
+    path = snapshot_path(root, name)
+    tmp_path = snapshot_path(root, f".{name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    faiss.write_index(snapshot.index, os.path.join(tmp_path, INDEX_FILE))
+    snapshot.catalog.save(tmp_path)
+    snapshot.lexical.save(tmp_path)
+    snapshot.prefix.save(tmp_path)
+    if snapshot.docs is not None:
+        snapshot.docs.save(tmp_path)
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "version": snapshot.version,
+            "built_at": snapshot.built_at,
+            "as_of": snapshot.as_of,
+            "books": len(snapshot.catalog),
+            "index": index_factory.describe(snapshot.index),
+        }, f)
+    os.replace(tmp_path, path)
+
+    pointer = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(pointer, "w") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+
+    # Processes still searching an old snapshot keep their mappings after the files are unlinked
+    names = sorted(n for n in os.listdir(os.path.join(root, SNAPSHOTS_DIR)) if not n.startswith("."))
+    for old in names[:-keep] if keep else []:
+        if old != name:
+            shutil.rmtree(snapshot_path(root, old), ignore_errors=True)
+    return name
+
+
+def read_index(path, kind=None, mmap=True):
+    """
+    Opens a FAISS index file. With mmap the vectors stay in the page cache,
+    shared by every process that opens the same file, and the index is
+    read-only: patch a heap copy from read_index(path, mmap=False) instead.
+    """
+    if mmap:
+        # Inverted lists (ivf, ivfpq) and flat codes (flat, hnsw) are mapped by different flags
+        flags = faiss.IO_FLAG_MMAP
+        if kind not in ("ivf", "ivfpq"):
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", flags)
+        try:
+            return faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Could not memory-map {path}, reading it into memory: {e}", flush=True)
+    return faiss.read_index(path)
+
+
+def open_snapshot(root, name=None, mmap=True):
+    """Opens the named snapshot, by default the current one. Returns None if there is none."""
+    name = name or current_name(root)
+    if name is None or not os.path.isdir(snapshot_path(root, name)):
+        return None
+    path = snapshot_path(root, name)
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    index = read_index(os.path.join(path, INDEX_FILE), manifest["index"]["type"], mmap)
+    return Snapshot(
+        index, Catalog.open(path, mmap), manifest["built_at"], name,
+        docs=DocMap.open(path, mmap), as_of=manifest.get("as_of"), lexical=BM25Index.open(path, mmap),
+        prefix=PrefixIndex.open(path, mmap),
+    )
+
+
+@contextmanager
+def rebuild_lock(root):
+    """Holds an exclusive lock on INDEX_PATH, so only one process at a time builds a snapshot."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".rebuild.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SnapshotWatcher:
+    """
+    Notices when another process points `current` at a new snapshot.
+
+    check() is cheap enough to call on every request: it reads the pointer
+    file at most once per `interval` seconds and, if it names a snapshot
+    other than `loaded`, calls on_change(name) in that request's thread.
+    """
+
+    def __init__(self, root, interval, on_change):
+        self.root = root
+        self.interval = interval
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self.reloads = 0
+
+    def check(self, loaded, force=False):
+        if not force and time.monotonic() < self._next_check:
+            return
+        # One thread reloads, the others keep serving the snapshot they have
+        if not self._lock.acquire(blocking=force):
+            return
+        try:
+            self._next_check = time.monotonic() + self.interval
+            name = current_name(self.root)
+            if name is not None and name != loaded:
+                self.on_change(name)
+                self.reloads += 1
+        finally:
+            self._lock.release()
+
+
+class RebuildWorker:
+    """
+    Runs index rebuilds one at a time on a background thread.
+
+    submit() returns a job record straight away; a rebuild asked for while
+    another one is still queued is merged into it. The last `keep` jobs
+    stay available to job() for status polling. With `jobs_dir` each job is
+    also written there as JSON, so any worker process can report on it.
+    """
+
+    def __init__(self, build, keep=20, jobs_dir=None):
+        self.build = build
+        self.keep = keep
+        self.jobs_dir = jobs_dir
+        self._jobs = OrderedDict()
+        self._queue = PerProcess(self._start)
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def _start(self):
+        # Jobs queued before a fork belong to the parent's thread
+        self._pending = None
+        jobs = queue.Queue()
+        threading.Thread(target=self._run, args=(jobs,), name="index-rebuild", daemon=True).start()
+        return jobs
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        if not self.jobs_dir:
+            return
+        tmp_path = self._job_path(f".{job['id']}")
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_path(job["id"]))
+
+    def submit(self, **kwargs) -> dict:
+        with self._lock:
+            jobs = self._queue.get()
+            pending = self._pending
+            if pending is not None and pending["status"] == "queued":
+                # A full rebuild covers an incremental one, never the other way round
+                args = pending["args"]
+                args["full"] = args.get("full", False) or kwargs.get("full", False)
+                args["if_missing"] = args.get("if_missing", False) and kwargs.get("if_missing", False)
+                if args.get("compacting") != kwargs.get("compacting"):
+                    # Only a compaction of the same snapshot may still be skipped
+                    args.pop("compacting", None)
+                self._save(pending)
+                return dict(pending)
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "status": "queued",
+                "pid": os.getpid(),
+                "args": kwargs,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > self.keep:
+                old_id, _ = self._jobs.popitem(last=False)
+                if self.jobs_dir:
+                    try:
+                        os.remove(self._job_path(old_id))
+                    except FileNotFoundError:
+                        pass
+            if self.jobs_dir:
+                os.makedirs(self.jobs_dir, exist_ok=True)
+            self._save(job)
+            self._pending = job
+            jobs.put(job)
+            return dict(job)
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None or not self.jobs_dir or not job_id.isalnum():
+                return dict(job) if job else None
+        # Submitted to another worker process
+        try:
+            with open(self._job_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def running(self) -> bool:
+        with self._lock:
+            return self._pending is not None and self._pending["status"] in ("queued", "running")
+
+    def _run(self, jobs):
+        while True:
+            job = jobs.get()
+            with self._lock:
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                args = dict(job["args"])
+                self._save(job)
+            try:
+                result = self.build(**args)
+            except Exception as e:
+                print(f"❌ Index rebuild {job['id']} failed: {e}", flush=True)
+                with self._lock:
+                    job["status"] = "failed"
+                    job["error"] = str(e)
+            else:
+                with self._lock:
+                    job["status"] = "done"
+                    job["result"] = result
+            with self._lock:
+                job["finished_at"] = time.time()
+                self._save(job)
@@ -0,0 +1,72 @@
+import json
+
+# Helpers for streaming chat replies to the browser as Server-Sent Events.
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_ndjson(response):
+    """Yields the JSON objects of an Ollama NDJSON stream as they arrive."""
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+def _partial_tag(text: str, tag: str) -> int:
+    # Length of the longest suffix of text that could be the start of tag
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ThinkFilter:
+    """
+    Drops <think>...</think> reasoning blocks from streamed tokens. Tags can be
+    split across tokens, so a possible partial tag is held back until the next
+    token arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.inside = False
+        self.strip = True  # no leading whitespace before the reply or after a think block
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        visible = ""
+        while self.buffer:
+            if self.inside:
+                end = self.buffer.find(THINK_CLOSE)
+                if end < 0:
+                    self.buffer = self.buffer[len(self.buffer) - _partial_tag(self.buffer, THINK_CLOSE):]
+                    break
+                self.buffer = self.buffer[end + len(THINK_CLOSE):]
+                self.inside = False
+                self.strip = True
+            else:
+                if self.strip:
+                    self.buffer = self.buffer.lstrip()
+                    if not self.buffer:
+                        break
+                    self.strip = False
+                start = self.buffer.find(THINK_OPEN)
+                if start < 0:
+                    keep = _partial_tag(self.buffer, THINK_OPEN)
+                    visible += self.buffer[:len(self.buffer) - keep]
+                    self.buffer = self.buffer[len(self.buffer) - keep:]
+                    break
+                visible += self.buffer[:start]
+                self.buffer = self.buffer[start + len(THINK_OPEN):]
+                self.inside = True
+        return visible
+
+    def flush(self) -> str:
+        rest = "" if self.inside else self.buffer
+        self.buffer = ""
+        return rest
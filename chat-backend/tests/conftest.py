@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service modules are imported the way app.py imports them, from chat-backend/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from autocomplete import KEY_BYTES, PrefixIndex, complete
+from catalog import Catalog
+
+BOOKS = [
+    {"title": "Émile ou de l'éducation", "authors": "Jean-Jacques Rousseau", "isbn": "978-2-08-070117-0", "stock_count": 2},
+    {"title": "Der Zauberberg", "authors": "Thomas Mann", "isbn": "978-3-596-29433-6", "stock_count": 0},
+    {"title": "Éloge de l'ombre", "authors": "Jun'ichirō Tanizaki", "isbn": None, "stock_count": 5},
+    {"title": "吾輩は猫である", "authors": "夏目漱石", "isbn": "978-4-10-101001-4", "stock_count": 1},
+    {"title": "Zazie dans le métro", "authors": "Raymond Queneau", "isbn": None, "stock_count": 1},
+    {"title": "Ομήρου Οδύσσεια", "authors": "Όμηρος", "isbn": None, "stock_count": 1},
+]
+
+
+@pytest.fixture(scope="module")
+def sources():
+    frame = pd.DataFrame(BOOKS, dtype=object)
+    frame["vector_id"] = range(1, len(BOOKS) + 1)
+    catalog = Catalog.from_dataframe(frame)
+    return [(catalog, PrefixIndex.from_catalog(catalog), None)]
+
+
+def titles(sources, prefix, k=10):
+    return [item["text"] for item in complete(sources, prefix, k) if item["kind"] == "title"]
+
+
+def test_keys_are_sorted_bytes(sources):
+    keys = sources[0][1].keys
+    assert len(keys) and (keys[:-1] <= keys[1:]).all()
+
+
+@pytest.mark.parametrize("prefix", ["", "   ", "?!"])
+def test_empty_prefix_suggests_nothing(sources, prefix):
+    index = sources[0][1]
+    assert index.entries("", 10).tolist() == []
+    assert complete(sources, prefix, 10) == []
+
+
+@pytest.mark.parametrize("prefix", ["zz", "zzz", "\U0010ffff"])
+def test_prefix_past_the_last_key_suggests_nothing(prefix):
+    index = PrefixIndex.build([{"title": "Dune", "authors": "Frank Herbert", "isbn": "9780441013593"}])
+    assert index.keys[-1] < prefix.encode("utf-8")
+    assert len(index.entries(prefix, 10)) == 0
+
+
+def test_prefix_after_every_catalog_key_suggests_nothing(sources):
+    assert complete(sources, "\U0010ffff", 10) == []
+
+
+def test_non_ascii_titles_match_by_their_own_letters(sources):
+    # Best stocked first; the start of a title beats a word inside it
+    assert titles(sources, "é") == ["Éloge de l'ombre", "Émile ou de l'éducation"]
+    assert titles(sources, "éd") == ["Émile ou de l'éducation"]
+    assert titles(sources, "mét") == ["Zazie dans le métro"]
+    assert titles(sources, "吾輩") == ["吾輩は猫である"]
+    authors = [item["text"] for item in complete(sources, "夏", 10) if item["kind"] == "author"]
+    assert authors == ["夏目漱石"]
+
+
+def test_keys_cut_inside_a_character_still_match(sources):
+    title = "ομήρου οδύσσεια"
+    # Two-byte letters: KEY_BYTES ends halfway through the "ε"
+    assert title.encode("utf-8")[:KEY_BYTES].decode("utf-8", "replace").endswith("\ufffd")
+    assert titles(sources, "Ομήρου Οδύσσεια") == ["Ομήρου Οδύσσεια"]
+    assert titles(sources, "ομήρου οδύσσει") == ["Ομήρου Οδύσσεια"]
+    # Same first KEY_BYTES, different letter after them
+    assert titles(sources, "ομήρου οδύσσα") == []
+    assert titles(sources, "ομήρου οδύσσεα") == []
+
+
+def test_one_and_two_byte_prefixes_agree_with_the_full_search(sources):
+    index = sources[0][1]
+    for prefix in ("z", "za", "é", "ja"):
+        top = index.entries(prefix, 8)
+        lo, hi = index._range(prefix.encode("utf-8"))
+        assert sorted(top.tolist()) == sorted(np.arange(lo, hi).tolist())
+
+
+def test_saved_index_is_the_same(sources, tmp_path):
+    index = sources[0][1]
+    index.save(str(tmp_path))
+    opened = PrefixIndex.open(str(tmp_path))
+    np.testing.assert_array_equal(opened.keys, index.keys)
+    np.testing.assert_array_equal(opened.entries("é", 10), index.entries("é", 10))
+    assert PrefixIndex.open(str(tmp_path / "missing")) is None
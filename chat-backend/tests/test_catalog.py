@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+
+from catalog import FIELDS, Catalog
+
+
+def books(**columns):
+    frame = {"vector_id": [1, 2], "title": ["Dune", "Emma"], "authors": ["Frank Herbert", "Jane Austen"]}
+    frame.update(columns)
+    return frame
+
+
+def to_json(records):
+    with Flask(__name__).app_context():
+        return json.loads(jsonify(records).get_data(as_text=True))
+
+
+def test_nulls_come_back_as_none_and_stay_valid_json():
+    # A numeric column with a null is float64 with NaN in pandas
+    frame = pd.DataFrame(books(stock_count=[3, None], sale_price=[9.99, np.nan], genres=["Sci-Fi", None]))
+    records = Catalog.from_dataframe(frame).lookup([1, 2])
+    assert records[1]["stock_count"] is None and records[1]["sale_price"] is None and records[1]["genres"] is None
+    assert to_json(records) == records
+
+
+def test_object_frames_keep_ints(tmp_path):
+    # fetch_catalog builds object columns, so stock counts stay ints next to nulls
+    frame = pd.DataFrame(books(stock_count=[3, None], isbn=["9780441013593", None]), dtype=object)
+    catalog = Catalog.from_dataframe(frame)
+    catalog.save(tmp_path)
+    for records in (catalog.lookup([1, 2]), Catalog.open(tmp_path).lookup([1, 2])):
+        assert records[0]["stock_count"] == 3 and isinstance(records[0]["stock_count"], int)
+        assert records[1]["stock_count"] is None and records[1]["isbn"] is None
+        assert set(records[0]) == set(FIELDS)
+        assert to_json(records) == records
@@ -0,0 +1,60 @@
+import numpy as np
+
+from embedding_store import EmbeddingStore, content_id
+
+
+def encode(texts):
+    # Stand-in for the model: one distinct vector per text
+    return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype="float32")
+
+
+def rebuild(store, texts):
+    """The delta step of app.build_index: encode only what is not stored yet."""
+    wanted = np.array([content_id(t) for t in texts], dtype="int64")
+    known, removed = store.delta(wanted)
+    added = [t for t, k in zip(texts, known) if not k]
+    store.update(wanted[known], wanted[~known], encode(added) if added else None)
+    return added, removed
+
+
+def test_content_id_is_stable_and_positive():
+    assert content_id("Dune by Frank Herbert") == content_id("Dune by Frank Herbert")
+    assert content_id("Dune by Frank Herbert") != content_id("Dune by Brian Herbert")
+    assert 0 <= content_id("") < 2 ** 63
+
+
+def test_delta_reuses_unchanged_and_drops_removed():
+    store = EmbeddingStore("model")
+    added, removed = rebuild(store, ["Emma by Jane Austen", "Dune by Frank Herbert", "Ulysses by James Joyce"])
+    assert len(added) == 3 and not len(removed)
+    # Distinct marker, so a reused vector is told apart from a re-encoded one
+    store.vectors[store._pos[content_id("Emma by Jane Austen")]] = -1
+
+    added, removed = rebuild(store, ["Emma by Jane Austen", "Dune by F. Herbert", "Persuasion by Jane Austen"])
+    assert added == ["Dune by F. Herbert", "Persuasion by Jane Austen"]
+    assert sorted(removed) == sorted([content_id("Dune by Frank Herbert"), content_id("Ulysses by James Joyce")])
+    assert len(store) == 3 and content_id("Ulysses by James Joyce") not in store
+    assert (store.get([content_id("Emma by Jane Austen")]) == -1).all()
+    np.testing.assert_array_equal(store.get([content_id("Dune by F. Herbert")]), encode(["Dune by F. Herbert"]))
+
+
+def test_delta_can_empty_the_store():
+    store = EmbeddingStore("model")
+    rebuild(store, ["Emma by Jane Austen"])
+    added, removed = rebuild(store, [])
+    assert added == [] and list(removed) == [content_id("Emma by Jane Austen")]
+    assert len(store) == 0 and store.vectors is None
+
+
+def test_save_and_load_keep_vectors_for_the_same_model(tmp_path):
+    path = str(tmp_path / "embeddings.npz")
+    store = EmbeddingStore("model")
+    rebuild(store, ["Emma by Jane Austen", "Dune by Frank Herbert"])
+    store.save(path)
+
+    loaded = EmbeddingStore.load(path, "model")
+    np.testing.assert_array_equal(loaded.ids, store.ids)
+    np.testing.assert_array_equal(loaded.vectors, store.vectors)
+    # Vectors from another model are discarded, so everything is encoded again
+    assert len(EmbeddingStore.load(path, "other-model")) == 0
+    assert len(EmbeddingStore.load(str(tmp_path / "missing.npz"), "model")) == 0
@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+import pytest
+
+from lexical import BM25Index, rrf, tokenize
+
+TEXTS = [
+    "Emma Jane Austen Romance",
+    "Persuasion Jane Austen Romance",
+    "Dune Frank Herbert Science Fiction",
+    "Dune Messiah Frank Herbert Science Fiction",
+    "Children of Dune Frank Herbert Science Fiction",
+]
+
+
+def bm25(query, texts, k1=1.2, b=0.75):
+    """Textbook Okapi BM25, to check the index against."""
+    docs = [tokenize(t) for t in texts]
+    avgdl = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in dict.fromkeys(tokenize(query)):
+            df = sum(term in d for d in docs)
+            tf = doc.count(term)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+
+@pytest.fixture(scope="module")
+def index():
+    return BM25Index.build(TEXTS)
+
+
+def test_scores_match_the_formula(index):
+    scores, rows = index.search("dune herbert", 10)
+    expected = bm25("dune herbert", TEXTS)
+    # The shortest document with both terms ranks first
+    assert rows.tolist() == [2, 3, 4]
+    np.testing.assert_allclose(scores, [expected[i] for i in rows], rtol=1e-5)
+    np.testing.assert_allclose(index.score("dune herbert", TEXTS), expected, rtol=1e-5)
+
+
+def test_rarer_terms_weigh_more(index):
+    _, rows = index.search("Austen messiah", 10)
+    assert rows.tolist() == [3, 0, 1]
+
+
+def test_ties_keep_catalog_order(index):
+    scores, rows = index.search("jane", 10)
+    assert rows.tolist() == [0, 1] and scores[0] == scores[1]
+    assert index.search("jane", 1)[1].tolist() == [0]
+
+
+@pytest.mark.parametrize("query", ["", "?!", "Middlemarch"])
+def test_no_shared_terms_means_no_hits(index, query):
+    scores, rows = index.search(query, 10)
+    assert len(scores) == len(rows) == 0
+    assert index.score(query, TEXTS).tolist() == [0.0] * len(TEXTS)
+
+
+def test_empty_index_has_no_hits():
+    assert len(BM25Index.build([]).search("dune", 10)[1]) == 0
+
+
+def test_saved_index_searches_the_same(index, tmp_path):
+    index.save(str(tmp_path))
+    opened = BM25Index.open(str(tmp_path))
+    for query in ("dune herbert", "jane", "science"):
+        np.testing.assert_array_equal(opened.search(query, 3)[1], index.search(query, 3)[1])
+    assert BM25Index.open(str(tmp_path / "missing")) is None
+
+
+def test_rrf_rewards_agreement():
+    vector = [10, 20, 30, 40]
+    lexical = [30, 50, 10]
+    # 10: 1/61 + 1/63, 30: 1/63 + 1/61, then 20: 1/62 ahead of 50: 1/62 by first appearance
+    assert rrf([vector, lexical], 10) == [10, 30, 20, 50, 40]
+    assert rrf([vector, lexical], 2) == [10, 30]
+
+
+def test_rrf_with_empty_lexical_hits_keeps_the_vector_order():
+    assert rrf([[7, 3, 5], []], 10) == [7, 3, 5]
+    # FAISS pads missing results with -1
+    assert rrf([[7, -1, -1], [-1]], 10) == [7]
+    assert rrf([[], []], 10) == []
+
+
+def test_rrf_k_flattens_rank_differences():
+    # A book second in both rankings beats one first in only one of them
+    assert rrf([[1, 2], [3, 2]], 3, k=60)[0] == 2
+    # With a small k the top ranks dominate
+    assert rrf([[1, 2, 4], [3, 5, 2]], 1, k=0) == [1]
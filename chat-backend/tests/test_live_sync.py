@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+import live_sync
+from live_sync import LiveSync
+
+
+def test_feed_survives_errors_outside_pymongo(monkeypatch):
+    monkeypatch.setattr(live_sync, "MongoClient", lambda uri: mongomock.MongoClient())
+    sync = LiveSync("mongodb://test", "db", "books", publish=None, encode=None, compact=None,
+                    mode="poll", poll_interval=0.01)
+    failed = []
+
+    def poll(collection):
+        if not failed:
+            failed.append(1)
+            raise ValueError("bad document")
+        sync._synced()
+        time.sleep(0.05)
+
+    monkeypatch.setattr(sync, "_poll", poll)
+    sync.start()
+    deadline = time.monotonic() + 5
+    while sync.last_sync is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = sync.stats()
+    assert stats["errors"] == 1
+    assert stats["last_error"] == "ValueError: bad document"
+    assert stats["seconds_since_sync"] is not None
+
+
+def base_snapshot(books):
+    import faiss
+    import numpy as np
+    import pandas as pd
+    from catalog import FIELDS, Catalog, DocMap
+    from snapshot import Snapshot
+
+    frame = pd.DataFrame([{field: book.get(field) for field in FIELDS} for book in books], dtype=object)
+    frame["vector_id"] = [live_sync.doc_vector_id(book) for book in books]
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(4))
+    index.add_with_ids(np.zeros((len(books), 4), dtype="float32"), frame["vector_id"].to_numpy(dtype="int64"))
+    docs = DocMap.from_columns([book["_id"] for book in books], frame["vector_id"])
+    return Snapshot(index, Catalog.from_dataframe(frame), docs=docs, as_of=time.time() - 60)
+
+
+def test_overlay_returns_changed_and_new_records_unchanged():
+    import numpy as np
+    dune = {"_id": "a", "title": "Dune", "authors": "Frank Herbert", "genres": "Sci-Fi", "isbn": "9780441013593",
+            "release_date": "1965-08-01", "std_price": 9.99, "sale_price": 7.99, "stock_count": 3}
+    published = []
+    sync = LiveSync("mongodb://test", "db", "books", publish=published.append,
+                    encode=lambda texts: np.ones((len(texts), 4), dtype="float32"), compact=None)
+    sync.rebase(base_snapshot([dune]))
+
+    restocked = {**dune, "stock_count": 999}
+    # A new book without genres, prices, release date or stock count
+    emma = {"_id": "b", "title": "Emma", "authors": "Jane Austen", "isbn": None}
+    sync.apply([("a", restocked), ("b", emma)])
+    catalog = published[-1].catalog
+    found = catalog.lookup([live_sync.doc_vector_id(dune), live_sync.doc_vector_id(emma)])
+    assert found == [live_sync.book_record(restocked), live_sync.book_record(emma)]
+    assert isinstance(found[0]["stock_count"], int) and found[1]["stock_count"] is None
+
+
+def test_overlay_version_depends_on_the_changes_not_the_process():
+    import numpy as np
+    dune = {"_id": "a", "title": "Dune", "authors": "Frank Herbert", "stock_count": 3}
+    emma = {"_id": "b", "title": "Emma", "authors": "Jane Austen", "stock_count": 1}
+
+    def overlay(*batches):
+        published = []
+        sync = LiveSync("mongodb://test", "db", "books", publish=published.append,
+                        encode=lambda texts: np.ones((len(texts), 4), dtype="float32"), compact=None)
+        sync.rebase(base_snapshot([dune]))
+        for batch in batches:
+            sync.apply(batch)
+        return published[-1].version
+
+    # Two workers that received the same changes in different batches share cache keys
+    same = overlay([("a", {**dune, "stock_count": 0}), ("b", emma)])
+    assert overlay([("b", emma)], [("a", {**dune, "stock_count": 0})]) == same
+    # A worker that has not seen the restock yet does not
+    assert overlay([("b", emma)]) != same
+    assert overlay([("a", None), ("b", emma)]) != same
@@ -0,0 +1,96 @@
+import asyncio
+
+from llm_client import chat_steps, run_chat, run_chat_async
+
+TOOLS = [
+    {"type": "function", "function": {"name": "book_search"}},
+    {"type": "function", "function": {"name": "reply"}},
+]
+
+
+def search_call(query):
+    return {"role": "assistant", "content": "", "tool_calls": [
+        {"function": {"name": "book_search", "arguments": {"query": query, "numberOfBooks": 2}}}
+    ]}
+
+
+def reply_call(text):
+    return {"role": "assistant", "content": "", "tool_calls": [{"function": {"name": "reply", "arguments": {"reply": text}}}]}
+
+
+def tool_message(name, args):
+    return {"role": "tool", "content": f"results for {args['query']}", "tool_name": name}
+
+
+def drive(answers, max_rounds=3):
+    """Runs chat_steps against scripted LLM answers, returns the messages and every step asked for."""
+    messages, asked = [{"role": "user", "content": "a space opera"}], []
+    steps, result = chat_steps(messages, TOOLS, max_rounds), None
+    answers = iter(answers)
+    try:
+        while True:
+            step = steps.send(result)
+            asked.append(step)
+            result = next(answers) if step[0] == "llm" else tool_message(step[1], step[2])
+    except StopIteration:
+        return messages, asked
+
+
+def test_search_then_reply_with_only_the_reply_tool():
+    messages, asked = drive([search_call("space opera"), reply_call("Try Dune.")])
+    assert [step[0] for step in asked] == ["llm", "tool", "llm"]
+    assert asked[1] == ("tool", "book_search", {"query": "space opera", "numberOfBooks": 2})
+    assert [tool["function"]["name"] for tool in asked[2][1]] == ["reply"]
+    assert messages[-1] == {"role": "assistant", "content": "Try Dune."}
+    assert messages[-2]["role"] == "assistant" and messages[-3]["role"] == "tool"
+
+
+def test_plain_content_ends_the_loop_without_reasoning():
+    messages, asked = drive([{"role": "assistant", "content": "{thinking} Hello there"}])
+    assert len(asked) == 1
+    assert messages[-1] == {"role": "assistant", "content": "Hello there"}
+
+
+def test_rounds_are_limited():
+    # A model that never stops searching gets max_rounds LLM calls
+    messages, asked = drive([search_call(f"query {i}") for i in range(10)], max_rounds=3)
+    assert [step[0] for step in asked].count("llm") == 3
+    assert [step[0] for step in asked].count("tool") == 3
+
+
+def test_llm_failure_and_unknown_tools_stop_the_loop():
+    messages, asked = drive([None])
+    assert len(asked) == 1 and messages == [{"role": "user", "content": "a space opera"}]
+    unknown = {"role": "assistant", "content": "", "tool_calls": [{"function": {"name": "weather", "arguments": {}}}]}
+    messages, asked = drive([unknown])
+    assert len(asked) == 1 and messages[-1] is unknown
+
+
+class ScriptedClient:
+    def __init__(self, answers):
+        self.answers = iter(answers)
+        self.tools = []
+
+    def chat(self, messages, tools):
+        self.tools.append([tool["function"]["name"] for tool in tools])
+        return {"message": next(self.answers)}
+
+
+class AsyncScriptedClient(ScriptedClient):
+    async def chat(self, messages, tools):
+        return super().chat(messages, tools)
+
+
+def test_sync_and_async_loops_dispatch_tools_the_same_way():
+    for run in (run_chat, lambda *args: asyncio.run(run_chat_async(*args))):
+        client_type = AsyncScriptedClient if run is not run_chat else ScriptedClient
+        client, calls = client_type([search_call("dune"), reply_call("Dune is in stock.")]), []
+
+        def run_tool(name, args):
+            calls.append((name, args["query"]))
+            return tool_message(name, args)
+
+        messages = run(client, [{"role": "user", "content": "dune"}], TOOLS, run_tool)
+        assert calls == [("book_search", "dune")]
+        assert client.tools == [["book_search", "reply"], ["reply"]]
+        assert messages[-1]["content"] == "Dune is in stock."
@@ -0,0 +1,30 @@
+import os
+import threading
+
+import pytest
+
+from batcher import MicroBatcher
+from per_process import PerProcess
+
+
+def test_value_is_made_once_per_process():
+    made = []
+    value = PerProcess(lambda: made.append(1) or len(made))
+    threads = [threading.Thread(target=value.get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert value.get() == 1 and made == [1]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_gets_its_own_worker_thread():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items])
+    assert batcher.submit(1) == 2
+    pid = os.fork()
+    if pid == 0:
+        # The parent's batching thread did not survive the fork
+        os._exit(0 if batcher.submit(21) == 42 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
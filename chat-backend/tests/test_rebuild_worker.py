@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from snapshot import RebuildWorker
+
+
+class Build:
+    """A rebuild that waits for release() and records the arguments of every run."""
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        self.started.set()
+        self.gate.wait(5)
+        if kwargs.get("fail"):
+            raise RuntimeError("db-backend unavailable")
+        return {"version": len(self.calls)}
+
+    def release(self):
+        self.gate.set()
+
+
+def wait_for(worker, job_id, status):
+    deadline = time.monotonic() + 5
+    while worker.job(job_id)["status"] != status:
+        assert time.monotonic() < deadline, worker.job(job_id)
+        time.sleep(0.01)
+    return worker.job(job_id)
+
+
+@pytest.fixture
+def build():
+    build = Build()
+    yield build
+    build.release()
+
+
+@pytest.fixture
+def busy(build):
+    """A worker whose first rebuild is still running, so later submits stay queued."""
+    worker = RebuildWorker(build)
+    first = worker.submit(full=True)
+    assert build.started.wait(5)
+    return worker, first
+
+
+def test_job_goes_from_queued_to_running_to_done(build, tmp_path):
+    worker = RebuildWorker(build, jobs_dir=str(tmp_path))
+    job = worker.submit(full=False)
+    assert job["status"] == "queued" and worker.running()
+    assert build.started.wait(5)
+    assert wait_for(worker, job["id"], "running")["started_at"] is not None
+
+    build.release()
+    done = wait_for(worker, job["id"], "done")
+    assert done["result"] == {"version": 1} and done["error"] is None
+    assert done["finished_at"] >= done["started_at"]
+    assert not worker.running()
+    # Another worker process reads the same job from jobs_dir
+    assert RebuildWorker(build, jobs_dir=str(tmp_path)).job(job["id"]) == done
+
+
+def test_failed_job_keeps_the_error(build):
+    worker = RebuildWorker(build)
+    build.release()
+    job = worker.submit(fail=True)
+    failed = wait_for(worker, job["id"], "failed")
+    assert failed["error"] == "db-backend unavailable" and failed["result"] is None
+    assert worker.job("unknown") is None
+
+
+def test_queued_rebuilds_are_merged(busy, build):
+    worker, first = busy
+    second = worker.submit(full=False)
+    assert second["id"] != first["id"]
+    # A full rebuild covers the queued incremental one
+    assert worker.submit(full=True)["id"] == second["id"]
+
+    build.release()
+    assert wait_for(worker, second["id"], "done")
+    assert build.calls == [{"full": True}, {"full": True, "if_missing": False}]
+
+
+def test_if_missing_only_survives_when_every_request_allows_it(busy, build):
+    worker, _ = busy
+    second = worker.submit(full=False, if_missing=True)
+    worker.submit(full=False, if_missing=True)
+    assert worker.job(second["id"])["args"]["if_missing"] is True
+    worker.submit(full=False)
+    assert worker.job(second["id"])["args"]["if_missing"] is False
+
+
+def test_compaction_is_only_kept_for_the_same_snapshot(busy, build):
+    worker, _ = busy
+    second = worker.submit(full=False, compacting="snap-1")
+    worker.submit(full=False, compacting="snap-1")
+    assert worker.job(second["id"])["args"]["compacting"] == "snap-1"
+    # Any other request still has to run even if snap-1 was already replaced
+    worker.submit(full=False, compacting="snap-2")
+    assert "compacting" not in worker.job(second["id"])["args"]
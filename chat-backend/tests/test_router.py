@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from catalog import Catalog
+from router import Router
+
+TITLES = ["Hello", "Help", "It", "Thank You", "The Name of the Wind", "Dune"]
+
+
+@pytest.fixture
+def catalog():
+    books = pd.DataFrame({
+        "vector_id": range(len(TITLES)),
+        "title": TITLES,
+        "authors": "Someone",
+        "isbn": [f"97800000000{i:02d}" for i in range(len(TITLES))],
+        "std_price": 10.0,
+        "sale_price": 8.0,
+        "stock_count": 3,
+    })
+    return Catalog.from_dataframe(books)
+
+
+@pytest.fixture
+def router():
+    # No FAQ service and no vector route, only the exact matches
+    return Router(faq_url="", vector_min_similarity=2)
+
+
+def no_vector_search(text):
+    raise AssertionError("vector route is disabled")
+
+
+@pytest.mark.parametrize("message", ["hello", "Hello!", "Help", "it", "Thank you!", "dune"])
+def test_short_messages_are_left_to_the_llm(router, catalog, message):
+    assert router.route(message, catalog, no_vector_search) is None
+
+
+@pytest.mark.parametrize("message", ["Do you have Dune?", "looking for it", "the name of the wind"])
+def test_titles_asked_for_or_long_enough_are_routed(router, catalog, message):
+    route, reply = router.route(message, catalog, no_vector_search)
+    assert route == "title"
+    assert reply.startswith("Yes, we have ")
+
+
+def test_isbn_is_routed_whatever_its_length(router, catalog):
+    route, reply = router.route("9780000000005", catalog, no_vector_search)
+    assert route == "isbn"
+    assert "Dune" in reply
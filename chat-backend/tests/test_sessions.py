@@ -0,0 +1,106 @@
+import pytest
+
+import cache
+import sessions
+from sessions import SUMMARY_PREFIX, SessionStore, compact_history, estimate_tokens
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions, "time", clock)
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, clock):
+    return SessionStore(maxsize=2, ttl=60, backend=request.param, db_path=str(tmp_path / "sessions.db"))
+
+
+def conversation():
+    return [
+        {"role": "system", "content": "You recommend books."},
+        {"role": "user", "content": "Something like Emma"},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "1", "function": {"name": "book_search"}}]},
+        {"role": "tool", "tool_call_id": "1", "content": "Persuasion by Jane Austen (Genres: Romance, ISBN: 1)\n"
+                                                          "Middlemarch by George Eliot (Genres: Classic, ISBN: 2)"},
+        {"role": "assistant", "content": "Try Persuasion."},
+        {"role": "user", "content": "Anything shorter?"},
+        {"role": "assistant", "content": "Northanger Abbey."},
+        {"role": "user", "content": "Thanks"},
+    ]
+
+
+def test_sessions_round_trip_and_expire(store, clock):
+    store.save("a", [{"role": "user", "content": "hi"}])
+    assert store.get("a") == [{"role": "user", "content": "hi"}]
+    assert store.get("missing") is None
+
+    clock.now += 61
+    assert store.get("a") is None
+    # Saving again restarts the clock
+    store.save("a", [])
+    assert store.get("a") == []
+
+
+def test_memory_sessions_are_bounded(clock):
+    store = SessionStore(maxsize=2, ttl=0)
+    for session_id in "abc":
+        store.save(session_id, [])
+    assert store.get("a") is None and store.get("c") == []
+
+
+def test_sqlite_sessions_are_shared_between_stores(tmp_path, clock):
+    path = str(tmp_path / "sessions.db")
+    SessionStore(backend="sqlite", db_path=path).save("a", [{"role": "user", "content": "hi"}])
+    # What another worker process, or a restarted one, sees
+    other = SessionStore(backend="sqlite", db_path=path)
+    assert other.get("a") == [{"role": "user", "content": "hi"}]
+    assert other.stats() == {"backend": "sqlite", "size": 1, "ttl": 3600}
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        SessionStore(backend="redis")
+
+
+def test_short_histories_are_left_alone():
+    messages = conversation()[:5]
+    assert compact_history(messages, budget=1) == messages
+
+
+def test_older_tool_output_is_cut_to_titles():
+    messages = conversation()
+    compacted = compact_history(messages, budget=10_000)
+    assert compacted[0] == messages[0] and compacted[-3:] == messages[-3:]
+    # The assistant message that only held tool calls has nothing left to keep
+    assert [m["role"] for m in compacted[1:-3]] == ["user", "tool", "assistant"]
+    assert compacted[2]["content"] == SUMMARY_PREFIX + "Persuasion by Jane Austen; Middlemarch by George Eliot"
+    assert compact_history(compacted, budget=10_000) == compacted
+
+
+def test_oldest_messages_are_dropped_to_fit_the_budget():
+    messages = conversation()
+    full = compact_history(messages, budget=10_000)
+    needed = sum(estimate_tokens(m) for m in full)
+    # Exactly enough fits everything, one token less drops the oldest message
+    assert compact_history(messages, budget=needed) == full
+    assert compact_history(messages, budget=needed - 1) == [full[0]] + full[2:]
+
+
+def test_recent_turns_are_kept_over_budget():
+    messages = conversation()
+    compacted = compact_history(messages, budget=0)
+    assert compacted == [messages[0]] + messages[-3:]
+    assert compact_history(messages[1:], budget=0) == messages[-3:]
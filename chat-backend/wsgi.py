@@ -0,0 +1,5 @@
+import app as chat
+
+# Runs once in the gunicorn master with preload_app, workers inherit the open snapshot
+chat.load_snapshot()
+app = chat.app
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+# chat-backend and db-backend both have an app.py and a metrics.py, imported
+# by plain name. When both test suites run in one pytest process, every test
+# (and the fixtures it sets up) gets the modules of the service it belongs to.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SERVICES = [os.path.join(ROOT, name) for name in ("chat-backend", "db-backend")]
+SHARED = ("app", "metrics")
+_loaded = {service: {} for service in SERVICES}
+
+
+def _service(item):
+    return next((s for s in SERVICES if str(item.path).startswith(s + os.sep)), None)
+
+
+def _belongs(module, service):
+    path = getattr(module, "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == service
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_setup(item):
+    service = _service(item)
+    if service is None:
+        return
+    for name in SHARED:
+        module = sys.modules.get(name)
+        if module is not None and not _belongs(module, service):
+            del sys.modules[name]
+        if name in _loaded[service]:
+            sys.modules[name] = _loaded[service][name]
+    sys.path.insert(0, service)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_runtest_teardown(item):
+    service = _service(item)
+    if service is None:
+        return
+    sys.path.remove(service)
+    for name in SHARED:
+        module = sys.modules.get(name)
+        if module is not None and _belongs(module, service):
+            _loaded[service][name] = module
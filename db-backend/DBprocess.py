@@ -1,32 +1,105 @@
 import os
-from pathlib import Path
+import re
+import time
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import List, Dict, Any, Optional
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from pydantic import BaseModel
-from pymongo import MongoClient, ASCENDING, TEXT
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, TEXT, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, PyMongoError
 from rapidfuzz import process, fuzz
+from metrics import HTTP_SECONDS, INGEST_ROWS, MongoCommandTimer, span
+import metrics
+
+try:
+    import redis
+except ImportError:  # the shared search cache is optional
+    redis = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # the semantic FAQ tier is optional
+    SentenceTransformer = None
 
 # -----------------------------
 # Env & Mongo
 # -----------------------------
 load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
+# Not app.py's "mydb": books here follow the CSV schema (author, not authors) and get a
+# unique title/author/isbn index and trigram fields that app.py's books must not get
 DB_NAME = os.getenv("DB_NAME", "library")
 BOOKS_COLL = os.getenv("BOOKS_COLL", "books")
 FAQ_COLL = os.getenv("FAQ_COLL", "faqs")
+FAQ_META_COLL = os.getenv("FAQ_META_COLL", "faq_meta")
+CATALOG_META_COLL = os.getenv("CATALOG_META_COLL", "catalog_meta")
 USE_ATLAS_SEARCH = os.getenv("USE_ATLAS_SEARCH", "true").lower() == "true"
 
+# CSV upserts: rows parsed per chunk, operations per bulk_write, bulk_writes in flight at once
+UPLOAD_CHUNK_ROWS = int(os.getenv("UPLOAD_CHUNK_ROWS", "5000"))
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "1000"))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_MAX_ERRORS = int(os.getenv("UPLOAD_MAX_ERRORS", "100"))
+
+# FAQ matching: fuzzy score (0-100) to answer, threads for batch scoring (-1 = all cores), largest /faq/batch
+FAQ_MIN_SCORE = int(os.getenv("FAQ_MIN_SCORE", "75"))
+FAQ_WORKERS = int(os.getenv("FAQ_WORKERS", "-1"))
+FAQ_BATCH_MAX = int(os.getenv("FAQ_BATCH_MAX", "1000"))
+# Optional paraphrase tier: a sentence-transformers model name, empty turns it off
+FAQ_EMBED_MODEL = os.getenv("FAQ_EMBED_MODEL", "")
+FAQ_EMBED_MIN_SIM = float(os.getenv("FAQ_EMBED_MIN_SIM", "0.8"))
+# search_books: seconds between capability checks, failures before a backend is skipped and for how long,
+# and the time limit of one trigram query
+SEARCH_PROBE_SECONDS = float(os.getenv("SEARCH_PROBE_SECONDS", "60"))
+SEARCH_BREAKER_FAILURES = int(os.getenv("SEARCH_BREAKER_FAILURES", "3"))
+SEARCH_BREAKER_SECONDS = float(os.getenv("SEARCH_BREAKER_SECONDS", "30"))
+SEARCH_NGRAM_MAX_MS = int(os.getenv("SEARCH_NGRAM_MAX_MS", "500"))
+# search_books results per catalog version: entries, seconds, optional Redis shared by all replicas,
+# and how often a replica picks up a version bumped by another one
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_REDIS_URL = os.getenv("SEARCH_CACHE_REDIS_URL", "")
+SEARCH_CACHE_VERSION_SECONDS = float(os.getenv("SEARCH_CACHE_VERSION_SECONDS", "1"))
+
+# How often each replica checks the FAQ generation, 0 turns the background reload off
+FAQ_POLL_SECONDS = float(os.getenv("FAQ_POLL_SECONDS", "5"))
+
 if not MONGODB_URI:
     raise RuntimeError("MONGODB_URI is required (set it in .env).")
 
-client = MongoClient(MONGODB_URI)
+# The pool must have room for every concurrent bulk_write plus regular requests
+client = MongoClient(MONGODB_URI, maxPoolSize=max(100, UPLOAD_WORKERS * 2), event_listeners=[MongoCommandTimer()])
 db = client[DB_NAME]
 books = db[BOOKS_COLL]
 faqs = db[FAQ_COLL]
+faq_meta = db[FAQ_META_COLL]
+catalog_meta = db[CATALOG_META_COLL]
+
+
+def start_daemon(fn, interval: float, name: str):
+    """Calls fn every `interval` seconds on a daemon thread; 0 or less starts nothing."""
+    if interval <= 0:
+        return
+
+    def loop():
+        while True:
+            try:
+                fn()
+            except Exception as e:
+                # Keep polling, the state from the last successful call stays in use
+                print(f"{name} failed: {e}", flush=True)
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name=name, daemon=True).start()
 
 # -----------------------------
 # Index helpers
@@ -57,6 +130,16 @@ def ensure_indexes():
     except Exception:
         pass
 
+    # Substring fallback: trigrams of title and author, see ngrams()
+    try:
+        books.create_index([("_ngrams", ASCENDING)], name="ngrams")
+    except Exception:
+        pass
+    try:
+        books.create_index([("_prefixes", ASCENDING)], name="prefixes")
+    except Exception:
+        pass
+
     # FAQs: unique question
     try:
         faqs.create_index([("question", ASCENDING)], unique=True, name="uniq_question")
@@ -68,33 +151,116 @@ ensure_indexes()
 # -----------------------------
 # FAQ fuzzy store (cached view)
 # -----------------------------
+# Every replica keeps its own FAQStore. Whatever changes the faqs collection
+# bumps the counter in faq_meta; replicas poll that one small document and
+# reload in the background when it moved.
+FAQ_GENERATION_ID = "faqs"
+
+def faq_generation() -> int:
+    doc = faq_meta.find_one({"_id": FAQ_GENERATION_ID}, {"generation": 1})
+    return doc["generation"] if doc else 0
+
+def bump_faq_generation() -> int:
+    doc = faq_meta.find_one_and_update(
+        {"_id": FAQ_GENERATION_ID},
+        {"$inc": {"generation": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["generation"]
+
 class FAQStore:
-    def __init__(self):
+    """
+    Everything a lookup needs is prepared on refresh: the normalized
+    questions rapidfuzz scores against and, with FAQ_EMBED_MODEL, their
+    embeddings. answer_many() scores a whole batch in one multi-threaded
+    process.cdist call; questions no FAQ matches fuzzily then get a cosine
+    similarity check, which catches paraphrases with few shared words.
+
+    watch() reloads on a background thread whenever the faq_meta generation
+    changes, so lookups only ever read the prepared state, never Mongo.
+    """
+
+    # Rows of the score matrix per cdist call, bounds memory for big batches
+    CHUNK = 256
+
+    def __init__(self, embed_model: str = ""):
+        self._model = None
+        if embed_model:
+            if SentenceTransformer is None:
+                print("FAQ_EMBED_MODEL is set but sentence-transformers is not installed, using fuzzy matching only", flush=True)
+            else:
+                self._model = SentenceTransformer(embed_model)
+        self.generation = None
+        self.reloads = 0
+        self._lock = threading.Lock()
         self._refresh()
 
     def _refresh(self):
+        with self._lock:
+            # Read before the FAQs, so a bump during the load triggers another one
+            generation = faq_generation()
+            self._load()
+            self.generation = generation
+            self.reloads += 1
+
+    def _load(self):
         docs = list(faqs.find({}, {"_id": 0, "question": 1, "answer": 1}))
-        self._q_to_a = {d["question"]: d["answer"] for d in docs}
-        self._norm_map = {self._norm(q): q for q in self._q_to_a.keys()}
+        questions = [d["question"] for d in docs]
+        vectors = None
+        if self._model is not None and questions:
+            vectors = self._model.encode(questions, normalize_embeddings=True, convert_to_numpy=True)
+        # One assignment, so a lookup running during a refresh sees either the old or the new FAQs
+        self._state = (questions, [d["answer"] for d in docs], [self._norm(q) for q in questions], vectors)
+
+    def check(self):
+        """Reloads if another replica (or this one) bumped the generation since the last load."""
+        if faq_generation() != self.generation:
+            self._refresh()
+
+    def watch(self, interval: float):
+        start_daemon(self.check, interval, "faq-reload")
 
     @staticmethod
     def _norm(text: str) -> str:
         return " ".join(text.lower().strip().split())
 
-    def answer(self, question: str, threshold: int = 75):
-        if not question.strip() or not self._q_to_a:
-            return None
-        match, score, _ = process.extractOne(
-            self._norm(question),
-            list(self._norm_map.keys()),
-            scorer=fuzz.token_set_ratio
-        )
-        if score >= threshold:
-            canonical_q = self._norm_map[match]
-            return {"question": canonical_q, "answer": self._q_to_a[canonical_q], "confidence": score}
-        return None
-
-FAQ_STORE = FAQStore()
+    def __len__(self):
+        return len(self._state[0])
+
+    def answer(self, question: str, threshold: int = FAQ_MIN_SCORE):
+        return self.answer_many([question], threshold)[0]
+
+    def answer_many(self, questions: List[str], threshold: int = FAQ_MIN_SCORE) -> List[Optional[Dict[str, Any]]]:
+        canonical, answers, choices, vectors = self._state
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        asked = [(i, self._norm(q)) for i, q in enumerate(questions) if q.strip()]
+        if not asked or not choices:
+            return results
+
+        for start in range(0, len(asked), self.CHUNK):
+            chunk = asked[start:start + self.CHUNK]
+            with span("faq_fuzzy"):
+                scores = process.cdist(
+                    [q for _, q in chunk], choices,
+                    scorer=fuzz.token_set_ratio, processor=None, workers=FAQ_WORKERS,
+                )
+            best = scores.argmax(axis=1)
+            for (i, _), j, score in zip(chunk, best, scores[np.arange(len(chunk)), best]):
+                if score >= threshold:
+                    results[i] = {"question": canonical[j], "answer": answers[j], "confidence": float(score), "match": "fuzzy"}
+
+        missed = [(i, q) for i, q in asked if results[i] is None]
+        if missed and vectors is not None:
+            with span("faq_semantic"):
+                similarity = self._model.encode([q for _, q in missed], normalize_embeddings=True, convert_to_numpy=True) @ vectors.T
+            best = similarity.argmax(axis=1)
+            for (i, _), j, sim in zip(missed, best, similarity[np.arange(len(missed)), best]):
+                if sim >= FAQ_EMBED_MIN_SIM:
+                    results[i] = {"question": canonical[j], "answer": answers[j], "confidence": round(float(sim) * 100, 1), "match": "semantic"}
+        return results
+
+FAQ_STORE = FAQStore(FAQ_EMBED_MODEL)
 
 # Seed default FAQs (idempotent)
 DEFAULT_FAQS = [
@@ -103,16 +269,23 @@ DEFAULT_FAQS = [
     {"question": "Do you offer refunds?", "answer": "Yes—within 30 days for undamaged items with a receipt."},
     {"question": "How long does shipping take?", "answer": "Most orders arrive in 3–7 business days in the U.S."},
 ]
+seeded = 0
 for faq in DEFAULT_FAQS:
     try:
         faqs.insert_one(faq)
+        seeded += 1
     except DuplicateKeyError:
         pass
-FAQ_STORE._refresh()
+if seeded:
+    bump_faq_generation()
+FAQ_STORE.check()
+FAQ_STORE.watch(FAQ_POLL_SECONDS)
 
 # -----------------------------
-# Search with Atlas Search (fallback to regex/text)
+# Search: Atlas Search, $text or the trigram index, whichever is available
 # -----------------------------
+BOOK_PROJECTION = {"_id": 0, "id": "$_id", "title": 1, "author": 1, "isbn": 1, "description": 1, "tags": 1}
+
 def atlas_search_pipeline(query: str, limit: int) -> List[Dict[str, Any]]:
     """
     Requires an Atlas Search index (e.g., named 'default') configured over fields:
@@ -148,56 +321,323 @@ def atlas_search_pipeline(query: str, limit: int) -> List[Dict[str, Any]]:
     ]
     return list(books.aggregate(pipeline))
 
-def fallback_search(query: str, limit: int) -> List[Dict[str, Any]]:
-    # Prefer $text when index exists; else regex OR logic
-    results: List[Dict[str, Any]] = []
-    try:
-        # $text
+def text_search(query: str, limit: int) -> List[Dict[str, Any]]:
+    cursor = books.find(
+        {"$text": {"$search": query}},
+        {**BOOK_PROJECTION, "score": {"$meta": "textScore"}},
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return list(cursor)
+
+# Trigram index for substring search. Each book stores the distinct
+# trigrams of its normalized title and author in `_ngrams` (multikey
+# index). A query needs every one of its trigrams; Mongo walks the index
+# range of one of them and checks the rest, and the escaped regex, on the
+# books in that range. That is far less than a collection scan, but still
+# grows with the number of books sharing the trigram, hence the time cap.
+# Queries too short for a trigram are one word of one or two characters;
+# they look up `_prefixes`, the first one and two characters of every word,
+# which is indexed the same way.
+NGRAM_FIELDS = ["title", "author"]
+NGRAM_RE = re.compile(r"[^0-9a-z]+")
+
+def normalize_ngram_text(text: str) -> str:
+    return " ".join(NGRAM_RE.sub(" ", str(text).lower()).split())
+
+def ngrams(text: str) -> List[str]:
+    text = normalize_ngram_text(text)
+    return sorted({text[i:i + 3] for i in range(len(text) - 2)})
+
+def book_ngrams(doc: Dict[str, Any]) -> List[str]:
+    return sorted({g for field in NGRAM_FIELDS if doc.get(field) for g in ngrams(doc[field])})
+
+def book_prefixes(doc: Dict[str, Any]) -> List[str]:
+    words = {w for field in NGRAM_FIELDS if doc.get(field) for w in normalize_ngram_text(doc[field]).split()}
+    return sorted({w[:n] for w in words for n in (1, 2)})
+
+def ngram_search(query: str, limit: int) -> List[Dict[str, Any]]:
+    text = normalize_ngram_text(query)
+    if not text:
+        return []
+    grams = ngrams(text)
+    if not grams:
+        cursor = books.find({"_prefixes": text}, BOOK_PROJECTION).hint("prefixes")
+    else:
+        # Same normalization as the trigrams: case, punctuation and spacing do not matter
+        pattern = "[^0-9a-z]+".join(re.escape(w) for w in text.split())
+        rx = {"$regex": pattern, "$options": "i"}
         cursor = books.find(
-            {"$text": {"$search": query}},
-            {
-                "_id": 0,
-                "id": "$_id",
-                "title": 1,
-                "author": 1,
-                "isbn": 1,
-                "description": 1,
-                "tags": 1,
-                "score": {"$meta": "textScore"},
-            },
-        ).sort([("score", {"$meta": "textScore"})]).limit(limit)
-        results = list(cursor)
-    except Exception:
-        pass
+            {"_ngrams": {"$all": grams}, "$or": [{field: rx} for field in NGRAM_FIELDS]},
+            BOOK_PROJECTION,
+        ).hint("ngrams")
+    return list(cursor.limit(limit).max_time_ms(SEARCH_NGRAM_MAX_MS))
+
+def backfill_ngrams(batch_size: int = 1000) -> int:
+    """Adds `_ngrams` and `_prefixes` to books written before they existed. Returns how many were updated."""
+    updated = 0
+    missing = {"$or": [{"_ngrams": {"$exists": False}}, {"_prefixes": {"$exists": False}}]}
+    while True:
+        docs = list(books.find(missing, {f: 1 for f in NGRAM_FIELDS}).limit(batch_size))
+        if not docs:
+            return updated
+        books.bulk_write([
+            UpdateOne({"_id": d["_id"]}, {"$set": {"_ngrams": book_ngrams(d), "_prefixes": book_prefixes(d)}})
+            for d in docs
+        ], ordered=False)
+        updated += len(docs)
+
+class CircuitBreaker:
+    """Skips a backend for `reset_after` seconds once it failed `failures` times in a row."""
+
+    def __init__(self, failures: int, reset_after: float):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.errors = 0
+        self.open_until = 0.0
+
+    def allow(self) -> bool:
+        # After the pause one call goes through; it closes or reopens the breaker
+        return self.errors < self.failures or time.monotonic() >= self.open_until
+
+    def success(self):
+        self.errors = 0
+
+    def failure(self):
+        self.errors += 1
+        if self.errors >= self.failures:
+            self.open_until = time.monotonic() + self.reset_after
+
+class SearchBackends:
+    """
+    Which search features this deployment has, checked once at startup and
+    again every SEARCH_PROBE_SECONDS on a background thread, so a request
+    never pays for trying a backend that is not there.
+
+    search() uses the best available primary backend (Atlas $search, then
+    $text) and the trigram index when that finds nothing or fails. Each
+    primary has a circuit breaker, so one failing at runtime is skipped
+    until the next probe or until its breaker lets a trial call through.
+    """
 
-    if not results:
-        # regex fallback across common fields (case-insensitive)
-        rx = {"$regex": query, "$options": "i"}
-        cursor = books.find(
-            {"$or": [{"title": rx}, {"author": rx}, {"description": rx}, {"tags": rx}]},
-            {"_id": 0, "id": "$_id", "title": 1, "author": 1, "isbn": 1, "description": 1, "tags": 1},
-        ).limit(limit)
-        results = list(cursor)
-    return results
+    PRIMARY = [("atlas", atlas_search_pipeline), ("text", text_search)]
 
-def search_books(query: str, limit: int = 10) -> List[Dict[str, Any]]:
-    if not query.strip():
-        return []
-    if USE_ATLAS_SEARCH:
+    def __init__(self):
+        self.available = {"atlas": False, "text": False}
+        self.breakers = {name: CircuitBreaker(SEARCH_BREAKER_FAILURES, SEARCH_BREAKER_SECONDS) for name, _ in self.PRIMARY}
+        self.probed_at = None
+
+    def probe(self):
+        available = {"atlas": False, "text": False}
+        if USE_ATLAS_SEARCH:
+            try:
+                list(books.aggregate([{"$search": {"index": "default", "exists": {"path": "title"}}}, {"$limit": 1}]))
+                available["atlas"] = True
+            except PyMongoError:
+                pass
         try:
-            hits = atlas_search_pipeline(query, limit)
+            available["text"] = any("textIndexVersion" in spec for spec in books.index_information().values())
+        except PyMongoError:
+            pass
+        for name, ok in available.items():
+            if ok and not self.available[name]:
+                self.breakers[name].success()
+        self.available = available
+        self.probed_at = time.time()
+
+    def watch(self, interval: float):
+        start_daemon(self._tick, interval, "search-probe")
+
+    def _tick(self):
+        try:
+            backfill_ngrams()
+        except Exception as e:
+            # A failed backfill must not stop the capability check
+            print(f"Trigram backfill failed: {e}", flush=True)
+        self.probe()
+
+    def search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        for name, run in self.PRIMARY:
+            breaker = self.breakers[name]
+            if not self.available[name] or not breaker.allow():
+                continue
+            try:
+                with span(f"search_{name}"):
+                    hits = run(query, limit)
+            except PyMongoError as e:
+                breaker.failure()
+                print(f"{name} search failed: {e}", flush=True)
+                continue
+            breaker.success()
             if hits:
                 return hits
-        except Exception:
-            # silently fall back if Atlas Search not configured
-            pass
-    return fallback_search(query, limit)
+            break
+        try:
+            with span("search_ngram"):
+                return ngram_search(query, limit)
+        except PyMongoError as e:
+            # Mostly SEARCH_NGRAM_MAX_MS running out; no results beats a failed /search or /chat
+            print(f"ngram search failed: {e}", flush=True)
+            return []
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "available": {**self.available, "ngram": True},
+            "open_breakers": [name for name, b in self.breakers.items() if not b.allow()],
+            "probed_at": self.probed_at,
+        }
+
+SEARCH_BACKENDS = SearchBackends()
+SEARCH_BACKENDS.probe()
+SEARCH_BACKENDS.watch(SEARCH_PROBE_SECONDS)
+
+# -----------------------------
+# Search result cache
+# -----------------------------
+# Results are keyed by catalog version. Every write to books bumps the
+# counter in catalog_meta, so a changed catalog is never answered from
+# the cache: the writing replica switches version at once, the others
+# within SEARCH_CACHE_VERSION_SECONDS.
+CATALOG_VERSION_ID = "books"
+
+def catalog_version() -> int:
+    doc = catalog_meta.find_one({"_id": CATALOG_VERSION_ID}, {"version": 1})
+    return doc["version"] if doc else 0
+
+def bump_catalog_version() -> int:
+    doc = catalog_meta.find_one_and_update(
+        {"_id": CATALOG_VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    SEARCH_CACHE.version = max(SEARCH_CACHE.version, doc["version"])
+    return doc["version"]
+
+class SearchCache:
+    """
+    LRU with TTL in each replica, optionally backed by Redis so replicas share
+    entries. Counts hits and the search time they saved.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, redis_url: str = ""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                print("SEARCH_CACHE_REDIS_URL is set but redis is not installed, caching per replica only", flush=True)
+            else:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.2)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def key(self, query: str, limit: int) -> str:
+        norm = " ".join(query.lower().split())
+        digest = hashlib.blake2b(f"{limit}:{norm}".encode("utf-8"), digest_size=12).hexdigest()
+        return f"books:{self.version}:{digest}"
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                self.saved_ms += entry[1]["ms"]
+                return entry[1]["results"]
+        value = None
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+                value = json.loads(raw) if raw is not None else None
+            except redis.RedisError:
+                pass
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+            self.saved_ms += value["ms"]
+        self._put_local(key, value)
+        return value["results"]
+
+    def _put_local(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def put(self, key: str, results: List[Dict[str, Any]], elapsed_ms: float):
+        if self.maxsize <= 0:
+            return
+        value = {"results": results, "ms": elapsed_ms}
+        self._put_local(key, value)
+        if self._redis is not None:
+            try:
+                self._redis.set(key, json.dumps(value, default=str), ex=max(1, int(self.ttl)))
+            except redis.RedisError:
+                pass
+
+    def watch(self, interval: float):
+        start_daemon(self.refresh, interval, "catalog-version")
+
+    def refresh(self):
+        version = catalog_version()
+        if version != self.version:
+            self.version = version
+            # Old versions can never be hit again
+            with self._lock:
+                self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "shared": self._redis is not None,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+            "saved_ms_per_hit": round(self.saved_ms / self.hits, 2) if self.hits else 0.0,
+        }
+
+SEARCH_CACHE = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_REDIS_URL)
+SEARCH_CACHE.version = catalog_version()
+SEARCH_CACHE.watch(SEARCH_CACHE_VERSION_SECONDS)
+
+def search_books(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    if not query.strip():
+        return []
+    key = SEARCH_CACHE.key(query, limit)
+    results = SEARCH_CACHE.get(key)
+    if results is None:
+        start = time.perf_counter()
+        results = SEARCH_BACKENDS.search(query, limit)
+        SEARCH_CACHE.put(key, results, (time.perf_counter() - start) * 1000)
+    return results
 
 # -----------------------------
 # FastAPI
 # -----------------------------
 app = FastAPI(title="Chatbot Backend (PyMongo: FAQ + Book Search)")
 
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template, so /upload_csv/{job_id} is one series and not one per job
+    route = request.scope.get("route")
+    HTTP_SECONDS.labels(request.method, route.path if route else "unmatched", response.status_code).observe(time.perf_counter() - start)
+    return response
+
 class SearchBody(BaseModel):
     query: str
     limit: int = 10
@@ -205,6 +645,9 @@ class SearchBody(BaseModel):
 class FAQBody(BaseModel):
     question: str
 
+class FAQBatchBody(BaseModel):
+    questions: List[str]
+
 class ChatBody(BaseModel):
     message: str
     limit: int = 10
@@ -215,66 +658,174 @@ def is_book_intent(text: str) -> bool:
     t = text.lower()
     return any(k in t for k in BOOK_KEYWORDS)
 
-@app.post("/upload_csv")
+# -----------------------------
+# CSV upsert jobs
+# -----------------------------
+UPLOAD_FIELDS = ["title", "author", "isbn", "description", "tags"]
+
+def upsert_ops(chunk: pd.DataFrame) -> List[UpdateOne]:
+    # Column-wise: strip every field at once, drop rows with neither title nor author
+    frame = pd.DataFrame(
+        {col: chunk[col].str.strip() if col in chunk.columns else "" for col in UPLOAD_FIELDS},
+        index=chunk.index,
+    )
+    frame = frame[(frame["title"] != "") | (frame["author"] != "")]
+    keys = frame[["title", "author", "isbn"]].to_dict("records")
+    docs = frame.to_dict("records")
+    # Derived from title and author, so an unchanged row stays unchanged
+    for doc in docs:
+        doc["_ngrams"] = book_ngrams(doc)
+        doc["_prefixes"] = book_prefixes(doc)
+    # Upsert rows based on (title, author, isbn)
+    return [UpdateOne(key, {"$set": doc}, upsert=True) for key, doc in zip(keys, docs)]
+
+class UploadJobs:
+    """
+    Background CSV upserts. Each job parses the CSV in chunks and sends
+    UPLOAD_BATCH_SIZE-operation bulk_writes, up to UPLOAD_WORKERS at a time,
+    over the shared client's connection pool. Counts come from the
+    BulkWriteResults, so they are exact.
+    """
+
+    def __init__(self, keep: int = 50):
+        self.keep = keep
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-job")
+        self._writers = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="bulk-write")
+
+    def submit(self, stream, filename: str) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "filename": filename,
+            "status": "queued",
+            "rows": 0,
+            "skipped": 0,
+            "inserted": 0,
+            "updated": 0,
+            "unchanged": 0,
+            "failed": 0,
+            "errors": [],
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+        self._runner.submit(self._run, job, stream)
+        return self.get(job["id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return {**job, "errors": list(job["errors"])} if job else None
+
+    def _update(self, job, **fields):
+        # Under the lock get() copies with, so a status poll never sees half an update
+        with self._lock:
+            job.update(fields)
+
+    def _count(self, job, inserted=0, updated=0, matched=0, write_errors=()):
+        if inserted or updated:
+            # Cached search results may miss these books
+            bump_catalog_version()
+        INGEST_ROWS.labels("inserted").inc(inserted)
+        INGEST_ROWS.labels("updated").inc(updated)
+        INGEST_ROWS.labels("unchanged").inc(matched - updated)
+        INGEST_ROWS.labels("failed").inc(len(write_errors))
+        with self._lock:
+            job["inserted"] += inserted
+            job["updated"] += updated
+            job["unchanged"] += matched - updated
+            job["failed"] += len(write_errors)
+            for error in write_errors[: max(0, UPLOAD_MAX_ERRORS - len(job["errors"]))]:
+                job["errors"].append({"error": error.get("errmsg", "write failed"), "op": error.get("op")})
+
+    def _write(self, job, ops):
+        try:
+            with span("ingest_bulk_write"):
+                res = books.bulk_write(ops, ordered=False)
+            self._count(job, res.upserted_count, res.modified_count, res.matched_count)
+        except BulkWriteError as e:
+            d = e.details
+            self._count(job, d.get("nUpserted", 0), d.get("nModified", 0), d.get("nMatched", 0), d.get("writeErrors", []))
+
+    def _run(self, job, stream):
+        self._update(job, status="running")
+        in_flight = set()
+        try:
+            with stream:
+                for chunk in pd.read_csv(stream, dtype=str, keep_default_na=False, chunksize=UPLOAD_CHUNK_ROWS):
+                    with span("ingest_parse"):
+                        ops = upsert_ops(chunk)
+                    INGEST_ROWS.labels("skipped").inc(len(chunk) - len(ops))
+                    with self._lock:
+                        job["rows"] += len(chunk)
+                        job["skipped"] += len(chunk) - len(ops)
+                    for start in range(0, len(ops), UPLOAD_BATCH_SIZE):
+                        # Bound the batches waiting on Mongo so memory stays at a few chunks
+                        if len(in_flight) >= UPLOAD_WORKERS * 2:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                future.result()
+                        in_flight.add(self._writers.submit(self._write, job, ops[start:start + UPLOAD_BATCH_SIZE]))
+            for future in wait(in_flight).done:
+                future.result()
+            self._update(job, status="done", finished_at=time.time())
+        except Exception as e:
+            print("❌ CSV upload error:", e)
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+
+UPLOAD_JOBS = UploadJobs()
+
+@app.post("/upload_csv", status_code=202)
 async def upload_csv(file: UploadFile = File(...)):
     """
-    Upload a CSV and upsert into MongoDB.
+    Upload a CSV and upsert into MongoDB in the background.
     Required columns: title, author
     Optional: isbn, description, tags
+    Returns the job; poll GET /upload_csv/{job_id} for progress and exact counts.
     """
-    tmp = Path(f"_upload_{file.filename}")
-    with open(tmp, "wb") as f:
-        f.write(await file.read())
-
-    df = pd.read_csv(tmp)
-    for col in ["title", "author", "isbn", "description", "tags"]:
-        if col not in df.columns:
-            df[col] = ""
-
-    # Upsert rows based on (title, author, isbn)
-    to_ops = []
-    for row in df.itertuples(index=False):
-        doc = {
-            "title": str(getattr(row, "title", "")).strip(),
-            "author": str(getattr(row, "author", "")).strip(),
-            "isbn": str(getattr(row, "isbn", "")).strip(),
-            "description": str(getattr(row, "description", "")).strip(),
-            "tags": str(getattr(row, "tags", "")).strip(),
-        }
-        if not doc["title"] and not doc["author"]:
-            continue
-        to_ops.append(
-            {
-                "updateOne": {
-                    "filter": {
-                        "title": doc["title"],
-                        "author": doc["author"],
-                        "isbn": doc["isbn"],
-                    },
-                    "update": {"$set": doc},
-                    "upsert": True,
-                }
-            }
-        )
-
-    inserted = 0
-    if to_ops:
-        res = books.bulk_write(to_ops, ordered=False)
-        # inserted count approximation (Mongo returns upserted ids separately)
-        inserted = (res.upserted_count or 0) + (res.modified_count or 0)
-
-    tmp.unlink(missing_ok=True)
-    return {"status": "ok", "processed": inserted}
+    # Read straight from the spooled upload through our own descriptor, the
+    # request closes its file object once this handler returns
+    stream = os.fdopen(os.dup(file.file.fileno()), "rb")
+    stream.seek(0)
+    return UPLOAD_JOBS.submit(stream, file.filename)
+
+@app.get("/upload_csv/{job_id}")
+def upload_csv_status(job_id: str):
+    job = UPLOAD_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown upload job")
+    return job
+
+@app.get("/metrics")
+def api_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 @app.post("/search")
 def api_search(body: SearchBody):
     return {"results": search_books(body.query, body.limit)}
 
+@app.get("/search/status")
+def api_search_status():
+    return {**SEARCH_BACKENDS.status(), "cache": SEARCH_CACHE.stats()}
+
 @app.post("/faq")
 def api_faq(body: FAQBody):
     ans = FAQ_STORE.answer(body.question)
     return {"answer": ans}
 
+@app.post("/faq/batch")
+def api_faq_batch(body: FAQBatchBody):
+    # Answers line up with the questions, null where no FAQ matched
+    if len(body.questions) > FAQ_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {FAQ_BATCH_MAX} questions per batch")
+    return {"answers": FAQ_STORE.answer_many(body.questions)}
+
 @app.post("/chat")
 def api_chat(body: ChatBody):
     text = body.message.strip()
@@ -295,8 +846,17 @@ def api_faq_upsert_defaults():
             added += 1
         except DuplicateKeyError:
             pass
-    FAQ_STORE._refresh()
-    return {"status": "ok", "added": added}
+    if added:
+        bump_faq_generation()
+    FAQ_STORE.check()
+    return {"status": "ok", "added": added, "generation": FAQ_STORE.generation}
+
+@app.post("/faq/reload")
+def api_faq_reload():
+    # After editing the faqs collection directly (e.g. in mongo-express), makes every replica reload
+    generation = bump_faq_generation()
+    FAQ_STORE.check()
+    return {"status": "ok", "generation": generation, "faqs": len(FAQ_STORE)}
 
 # For local dev
 if __name__ == "__main__":
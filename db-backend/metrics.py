@@ -0,0 +1,50 @@
+import os
+from pymongo import monitoring
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+# Prometheus metrics for GET /metrics of app.py and DBprocess.py.
+#
+# Every command a MongoClient sends (find, getMore, insert, update,
+# aggregate...) is timed by MongoCommandTimer, pass it in event_listeners.
+# db_stage_seconds covers the work around the queries: CSV parsing, search
+# backends and FAQ matching. With several worker processes set
+# PROMETHEUS_MULTIPROC_DIR and /metrics adds the workers up.
+
+# From an indexed find_one up to a whole CSV chunk
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_SECONDS = Histogram(
+    "db_http_request_seconds", "Time to the response headers, by route", ["method", "route", "status"], buckets=BUCKETS
+)
+MONGO_SECONDS = Histogram("db_mongo_command_seconds", "Mongo command round trips", ["command", "outcome"], buckets=BUCKETS)
+STAGE_SECONDS = Histogram("db_stage_seconds", "Time spent in each stage of a search or upload", ["stage"], buckets=BUCKETS)
+INGEST_ROWS = Counter("db_ingest_rows_total", "CSV rows by what became of them", ["outcome"])
+
+
+def span(stage):
+    """Times the with-block into db_stage_seconds{stage=...}."""
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def render():
+    """Body and content type for /metrics."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    # Durations are measured by the driver, from sending the command to its reply
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_SECONDS.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture(scope="session")
+def mongo():
+    """One in-memory Mongo (mongomock) that app.py and DBprocess.py both connect to."""
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+
+    shared = mongomock.MongoClient()
+    original = pymongo.MongoClient
+    # Both modules connect at import; no probes, background threads or Atlas Search
+    pymongo.MongoClient = lambda *args, **kwargs: shared
+    os.environ.update(
+        MONGODB_URI="mongodb://test", USE_ATLAS_SEARCH="false", SEARCH_PROBE_SECONDS="0",
+        SEARCH_CACHE_VERSION_SECONDS="0", FAQ_POLL_SECONDS="0",
+    )
+    yield shared
+    pymongo.MongoClient = original
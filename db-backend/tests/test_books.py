@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client(mongo):
+    import app
+    app.collection.insert_one({"title": "Emma", "authors": "Jane Austen"})
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("query", ["?fields=_id,title", "?fields=_id,title&limit=10"])
+def test_ids_are_returned_as_strings(client, query):
+    response = client.get(f"/books{query}")
+    assert response.status_code == 200
+    body = response.get_json()
+    books = body["books"] if isinstance(body, dict) else body
+    assert books and all(isinstance(book["_id"], str) for book in books)
+
+
+def test_ndjson_ids_are_strings(client):
+    response = client.get("/books?format=ndjson&fields=_id,title")
+    assert response.status_code == 200
+    assert all('"_id": "' in line for line in response.get_data(as_text=True).splitlines())
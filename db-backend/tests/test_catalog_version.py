@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def services(mongo):
+    import app
+    import DBprocess
+    return app.app.test_client(), DBprocess
+
+
+def search_key(dbprocess):
+    dbprocess.SEARCH_CACHE.refresh()
+    return dbprocess.SEARCH_CACHE.key("dune", 10)
+
+
+def test_services_keep_their_books_apart(services):
+    import app
+    _, dbprocess = services
+    # The two collections use different schemas (authors vs author)
+    assert app.collection.full_name != dbprocess.books.full_name
+    assert "uniq_title_author_isbn" not in app.collection.index_information()
+
+
+def test_books_written_through_app_stay_as_sent(services):
+    client, dbprocess = services
+    csv = b"title,authors,isbn\nDune,Frank Herbert,9780441013593\nDune,Brian Herbert,9780441013593\n"
+    response = client.post("/upload_csv", data={"file": (io.BytesIO(csv), "books.csv")})
+    assert response.status_code == 201
+    dbprocess.backfill_ngrams()
+    books = client.get("/books").get_json()
+    assert sum(book["title"] == "Dune" for book in books) == 2
+    assert not any("_ngrams" in book for book in books)
+
+
+def test_a_catalog_write_changes_the_search_cache_key(services):
+    _, dbprocess = services
+    before = search_key(dbprocess)
+    # What every upsert batch of an upload job does
+    dbprocess.bump_catalog_version()
+    assert search_key(dbprocess) != before
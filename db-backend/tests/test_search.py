@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def dbprocess(mongo):
+    import DBprocess
+    return DBprocess
+
+
+@pytest.fixture
+def catalog(dbprocess, monkeypatch):
+    # mongomock cannot project "id": "$_id"
+    monkeypatch.setattr(dbprocess, "BOOK_PROJECTION", {"_id": 0, "title": 1, "author": 1})
+    docs = [
+        {"title": "Jane Eyre", "author": "Charlotte Bronte"},
+        {"title": "Ajax", "author": "Sophocles"},
+        # Every trigram of "abc abc" but not the phrase
+        {"title": "Xabc Ab", "author": "Someone Else"},
+        {"title": "Abc Abc", "author": "Someone"},
+    ]
+    for doc in docs:
+        doc.update(_ngrams=dbprocess.book_ngrams(doc), _prefixes=dbprocess.book_prefixes(doc), test_search=True)
+    dbprocess.books.insert_many(docs)
+    yield
+    dbprocess.books.delete_many({"test_search": True})
+
+
+def titles(results):
+    return sorted(book["title"] for book in results)
+
+
+def test_ngrams_ignore_case_and_punctuation(dbprocess):
+    assert dbprocess.ngrams("Eyre!") == dbprocess.ngrams("  eyre") == ["eyr", "yre"]
+    assert dbprocess.ngrams("ab") == []
+    assert dbprocess.book_prefixes({"title": "Jane Eyre", "author": None}) == ["e", "ey", "j", "ja"]
+
+
+def test_substrings_need_every_trigram_and_the_phrase(dbprocess, catalog):
+    assert titles(dbprocess.ngram_search("EYR", 10)) == ["Jane Eyre"]
+    assert titles(dbprocess.ngram_search("bronte", 10)) == ["Jane Eyre"]
+    # "Xabc Ab" holds every trigram of the query but not the query itself
+    assert titles(dbprocess.ngram_search("abc abc", 10)) == ["Abc Abc"]
+
+
+def test_short_queries_match_word_starts_only(dbprocess, catalog):
+    assert titles(dbprocess.ngram_search("ja", 10)) == ["Jane Eyre"]
+    assert titles(dbprocess.ngram_search("A", 10)) == ["Abc Abc", "Ajax", "Xabc Ab"]
+    assert dbprocess.ngram_search("?!", 10) == []
+
+
+def test_breaker_opens_after_repeated_failures_and_retries_later(dbprocess, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(dbprocess.time, "monotonic", lambda: now[0])
+    breaker = dbprocess.CircuitBreaker(failures=2, reset_after=30)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+
+    now[0] += 30
+    # One trial call; failing it reopens the breaker for another pause
+    assert breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+
+    now[0] += 30
+    breaker.success()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.allow()
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def app_module(mongo):
+    import app
+    return app
+
+
+def upload(app_module, csv):
+    client = app_module.app.test_client()
+    return client.post("/upload_csv", data={"file": (io.BytesIO(csv), "books.csv")})
+
+
+def test_cells_are_coerced_to_the_schema(app_module):
+    doc = app_module.coerce_row({
+        "title": " Emma ", "authors": "Jane Austen", "std_price": "$1,024.499",
+        "stock_count": "1,200.0", "release_date": "December 23, 1815",
+    })
+    assert doc == {
+        "title": "Emma", "authors": "Jane Austen", "std_price": 1024.5,
+        "stock_count": 1200, "release_date": "1815-12-23",
+    }
+
+
+def test_empty_typed_cells_become_null(app_module):
+    doc = app_module.coerce_row({"title": "Emma", "authors": "", "sale_price": " ", "stock_count": None})
+    # Plain text stays an empty string, typed columns are null
+    assert doc == {"title": "Emma", "authors": "", "sale_price": None, "stock_count": None}
+
+
+@pytest.mark.parametrize("row, error", [
+    ({"title": "Emma", "stock_count": "2.5"}, "stock_count: not a whole number"),
+    ({"title": "Emma", "std_price": "free"}, "std_price: could not convert"),
+    ({"title": "Emma", "release_date": "someday"}, "release_date: unrecognized date"),
+    ({"title": " ", "authors": "Jane Austen"}, "missing title"),
+    ({"title": "Emma", None: ["extra"]}, "more cells than header columns"),
+])
+def test_bad_rows_are_rejected(app_module, row, error):
+    with pytest.raises(ValueError, match=error):
+        app_module.coerce_row(row)
+
+
+def test_upload_where_every_row_fails_reports_the_count(app_module):
+    response = upload(app_module, b"title,stock_count\nEmma,many\n,3\n")
+    body = response.get_json()
+    assert response.status_code == 400
+    assert body["error"] == "No records inserted, all 2 rows failed"
+    assert body["inserted"] == 0 and body["failed"] == 2
+    assert [error["line"] for error in body["errors"]] == [2, 3]
+
+
+def test_partial_upload_inserts_the_good_rows(app_module):
+    response = upload(app_module, b"title,stock_count\nPersuasion,3\nEmma,many\n")
+    body = response.get_json()
+    assert response.status_code == 201
+    assert body["message"] == "Successfully inserted 1 records!"
+    assert body["failed"] == 1
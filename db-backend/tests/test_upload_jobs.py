@@ -0,0 +1,85 @@
+import io
+import time
+
+import pytest
+
+
+def wait_for(jobs, job_id):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        seen = jobs.get(job_id)
+        # Status, error and finish time change together
+        assert (seen["finished_at"] is None) == (seen["status"] in ("queued", "running"))
+        assert (seen["error"] is None) == (seen["status"] != "failed")
+        if seen["finished_at"] is not None:
+            return seen
+        time.sleep(0.001)
+    pytest.fail("upload job did not finish")
+
+
+@pytest.fixture
+def dbprocess(mongo, monkeypatch):
+    import DBprocess
+    import mongomock
+
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def without_sort(self, *args, sort=None, **kwargs):
+        # pymongo 4.11+ passes sort to every update, mongomock does not take it yet
+        return add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.BulkOperationBuilder, "add_update", without_sort)
+    # Small chunks and batches, so one upload runs several bulk_writes at a time
+    monkeypatch.setattr(DBprocess, "UPLOAD_CHUNK_ROWS", 4)
+    monkeypatch.setattr(DBprocess, "UPLOAD_BATCH_SIZE", 2)
+    yield DBprocess
+    DBprocess.books.delete_many({"author": "Upload Test"})
+
+
+def upload(dbprocess, csv):
+    job = dbprocess.UPLOAD_JOBS.submit(io.BytesIO(csv), "books.csv")
+    return wait_for(dbprocess.UPLOAD_JOBS, job["id"])
+
+
+def books_csv(count, description="first"):
+    rows = [f"Book {i},Upload Test,{1000 + i},{description}" for i in range(count)]
+    return ("title,author,isbn,description\n" + "\n".join(rows) + "\n").encode()
+
+
+def test_counts_are_exact_across_concurrent_bulk_writes(dbprocess):
+    first = upload(dbprocess, books_csv(20) + b",,,no title or author\n")
+    assert first["status"] == "done"
+    assert (first["rows"], first["skipped"], first["inserted"], first["failed"]) == (21, 1, 20, 0)
+    assert dbprocess.books.count_documents({"author": "Upload Test"}) == 20
+
+    # The same rows again are duplicates: matched, not inserted or changed
+    again = upload(dbprocess, books_csv(20))
+    assert (again["inserted"], again["updated"], again["unchanged"], again["failed"]) == (0, 0, 20, 0)
+    changed = upload(dbprocess, books_csv(20, description="second"))
+    assert (changed["inserted"], changed["updated"], changed["unchanged"]) == (0, 20, 0)
+    assert dbprocess.books.count_documents({"author": "Upload Test"}) == 20
+
+
+def test_rejected_writes_are_counted_as_failed(dbprocess):
+    # A stricter catalog where an isbn belongs to one book only
+    dbprocess.books.create_index("isbn", unique=True, name="test_uniq_isbn")
+    try:
+        job = upload(dbprocess, books_csv(4) + b"Book 1 Reprint,Upload Test,1001,first\n")
+    finally:
+        dbprocess.books.drop_index("test_uniq_isbn")
+    assert job["status"] == "done"
+    assert (job["rows"], job["inserted"], job["failed"]) == (5, 4, 1)
+    assert len(job["errors"]) == 1 and "duplicate key" in job["errors"][0]["error"].lower()
+    assert dbprocess.books.count_documents({"author": "Upload Test"}) == 4
+
+
+def test_finished_job(mongo):
+    import DBprocess
+    job = DBprocess.UPLOAD_JOBS.submit(io.BytesIO(b"title,author\n"), "books.csv")
+    assert wait_for(DBprocess.UPLOAD_JOBS, job["id"])["status"] == "done"
+
+
+def test_failed_job(mongo):
+    import DBprocess
+    job = DBprocess.UPLOAD_JOBS.submit(io.BytesIO(b""), "books.csv")
+    assert wait_for(DBprocess.UPLOAD_JOBS, job["id"])["status"] == "failed"